@@ -0,0 +1,174 @@
+"""Offline load test: many concurrent advisor sessions against the app, backed by the mock OpenAI server.
+
+The mock server runs on localhost and, unless --target is given, the app is driven in-process through
+httpx's ASGI transport, so nothing leaves the machine.
+
+    python -m bench.load_test --sessions 50 --turns 3 --script lookup --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_server(script, latency, token_latency, error_rate=0.0):
+    """Run the mock OpenAI server on a background thread and return its base URL"""
+    import uvicorn
+
+    from bench.mock_openai import create_app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(
+        create_app(script, latency, token_latency, error_rate), host="127.0.0.1", port=port, log_level="warning"
+    ))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("mock OpenAI server did not start")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.response_bytes = defaultdict(list)
+        self.request_bytes = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def request(self, http, route, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await http.request(method, url, **kwargs)
+            body = response.content
+        except httpx.HTTPError:
+            self.errors[route] += 1
+            return None
+        self.latencies[route].append(time.perf_counter() - started)
+        self.response_bytes[route].append(len(body))
+        self.request_bytes[route].append(len(response.request.content or b""))
+        if response.status_code >= 400:
+            self.errors[route] += 1
+        return response
+
+
+async def run_session(http, recorder, session_number, turns, stream):
+    session_id = f"bench-{session_number}"
+    await recorder.request(http, "/erase", "POST", "/erase", json={"clientName": "TIAA", "session_id": session_id})
+    await recorder.request(http, "/", "GET", "/")
+    chat_route = "/chat/stream" if stream else "/chat"
+    for turn in range(turns):
+        await recorder.request(http, chat_route, "POST", chat_route, json={
+            "message": f"Which of my Boston clients should I call first? ({turn})",
+            "session_id": session_id,
+        })
+    await recorder.request(http, "/manifest.json", "GET", "/manifest.json")
+
+
+def instrument_tools(main_module):
+    """Wrap the app's tool registry dispatch to time every tool execution"""
+    timings = defaultdict(list)
+    dispatch = main_module.tool_registry.dispatch
+
+    async def timed_dispatch(function_name, arguments):
+        started = time.perf_counter()
+        try:
+            return await dispatch(function_name, arguments)
+        finally:
+            timings[function_name].append(time.perf_counter() - started)
+
+    main_module.tool_registry.dispatch = timed_dispatch
+    return timings
+
+
+def report(recorder, tool_timings, elapsed):
+    total = sum(len(values) for values in recorder.latencies.values())
+    print(f"\n{total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s)\n")
+    print(f"{'route':<16}{'count':>7}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req B':>9}{'resp B':>10}")
+    for route in sorted(recorder.latencies):
+        latencies = recorder.latencies[route]
+        print(
+            f"{route:<16}{len(latencies):>7}{recorder.errors[route]:>8}"
+            f"{percentile(latencies, 50) * 1000:>9.1f}{percentile(latencies, 95) * 1000:>9.1f}"
+            f"{percentile(latencies, 99) * 1000:>9.1f}"
+            f"{statistics.mean(recorder.request_bytes[route]):>9.0f}"
+            f"{statistics.mean(recorder.response_bytes[route]):>10.0f}"
+        )
+    if tool_timings:
+        print(f"\n{'tool':<20}{'calls':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        for name in sorted(tool_timings):
+            timings = tool_timings[name]
+            print(
+                f"{name:<20}{len(timings):>7}{percentile(timings, 50) * 1000:>9.2f}"
+                f"{percentile(timings, 95) * 1000:>9.2f}{percentile(timings, 99) * 1000:>9.2f}"
+            )
+
+
+async def run(args):
+    tool_timings = {}
+    if args.target:
+        transport = None
+        base_url = args.target
+    else:
+        os.environ["OPENAI_BASE_URL"] = start_mock_server(
+            args.script, args.latency, args.token_latency, args.error_rate
+        )
+        os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+        import main
+
+        tool_timings = instrument_tools(main)
+        transport = httpx.ASGITransport(app=main.app)
+        base_url = "http://bench"
+
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits, timeout=120) as http:
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def bounded(session_number):
+            async with semaphore:
+                await run_session(http, recorder, session_number, args.turns, args.stream)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(bounded(number) for number in range(args.sessions)))
+        elapsed = time.perf_counter() - started
+
+    report(recorder, tool_timings, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3, help="chat turns per session")
+    parser.add_argument("--concurrency", type=int, default=20, help="sessions in flight at once")
+    parser.add_argument("--script", default="lookup", help="mock reply script, see bench/mock_openai.py")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock model latency per completion, seconds")
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of mock completions failing with 429/503")
+    parser.add_argument("--stream", action="store_true", help="drive /chat/stream instead of /chat")
+    parser.add_argument("--target", help="base URL of an already running app (it must be pointed at a mock server)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
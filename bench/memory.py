@@ -0,0 +1,147 @@
+"""Resident memory of the client book and fund universe, per representation, on a synthetic production-sized book.
+
+search_index is what the client search index adds on top of the repository it is built from; resident is the
+whole dataset a serving worker holds: repository, search index, fund table and the caches warmed on reload.
+
+Each representation is loaded in a fresh process and its RSS growth measured, since that is what limits how
+many workers fit on a node.
+
+    python -m bench.memory --clients 100000 --funds 5000
+"""
+import argparse
+import ctypes
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthesize(template_path, count, unique_fields, seed=7):
+    """count records cloned from the template file, with unique text in unique_fields like a real book would have"""
+    with open(template_path) as f:
+        template = json.load(f)
+    rng = random.Random(seed)
+    records = [record for records in template.values() for record in records] if isinstance(template, dict) else template
+    book = []
+    for index in range(count):
+        record = dict(records[index % len(records)])
+        for field in unique_fields:
+            if isinstance(record.get(field), str):
+                record[field] = f"{record[field]} #{index}"
+        for field, value in record.items():
+            if isinstance(value, int) and not isinstance(value, bool) and field not in ("age", "morningstar_rating"):
+                record[field] = int(value * rng.uniform(0.5, 1.5))
+        book.append(record)
+    return book
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def settle():
+    gc.collect()
+    try:
+        # hand freed heap pages back to the OS so RSS reflects what is still live
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except OSError:
+        pass
+
+
+def measure(representation, clients_path, funds_path):
+    """Runs in the child process: load one representation and return its RSS growth"""
+    sys.path.insert(0, ROOT)
+    os.environ["CLIENTS_PATH"] = os.path.join(ROOT, "data", "clients.json")
+    import numpy  # noqa: F401  imported up front so it is not counted against any representation
+
+    import client_repository
+    import client_search
+    import fund_screener
+
+    settle()
+    if representation == "resident":
+        # everything a serving worker keeps for the data: repository, search index, fund table, and the caches
+        # a dataset reload warms before swapping the snapshot in
+        import datasets
+
+        before = rss_bytes()
+        clients = client_repository.ClientRepository.from_json_file(clients_path)
+        funds = fund_screener.FundTable.from_json_file(funds_path)
+        held = (clients, client_search.ClientSearchIndex.from_repository(clients), funds)
+        datasets.DatasetStore._warm(clients, funds)
+        settle()
+        return rss_bytes() - before
+    if representation == "search_index":
+        # the index on top of the repository it is built from, counting only what the index adds
+        repository = client_repository.ClientRepository.from_json_file(clients_path)
+        settle()
+        before = rss_bytes()
+        held = client_search.ClientSearchIndex.from_repository(repository)
+        settle()
+        return rss_bytes() - before
+    before = rss_bytes()
+    if representation == "dicts":
+        # what the tools originally held: the parsed JSON, one dict per record
+        with open(clients_path) as f:
+            held = json.load(f)
+        with open(funds_path) as f:
+            held = (held, json.load(f))
+    else:
+        held = (
+            client_repository.ClientRepository.from_json_file(clients_path),
+            fund_screener.FundTable.from_json_file(funds_path),
+        )
+    settle()
+    return rss_bytes() - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=100000)
+    parser.add_argument("--funds", type=int, default=5000)
+    parser.add_argument("--cities", type=int, default=200)
+    parser.add_argument("--measure", nargs=3, metavar=("REPRESENTATION", "CLIENTS", "FUNDS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(measure(*args.measure))
+        return
+
+    clients = synthesize(os.path.join(ROOT, "data", "clients.json"), args.clients, ("name", "email", "details", "meeting_notes"))
+    funds = synthesize(os.path.join(ROOT, "data", "funds.json"), args.funds, ("name", "ticker"))
+    with tempfile.TemporaryDirectory() as directory:
+        clients_path = os.path.join(directory, "clients.json")
+        funds_path = os.path.join(directory, "funds.json")
+        book = {f"City {index}": [] for index in range(args.cities)}
+        for position, client in enumerate(clients):
+            book[f"City {position % args.cities}"].append(client)
+        with open(clients_path, "w") as f:
+            json.dump(book, f)
+        del book, clients
+        with open(funds_path, "w") as f:
+            json.dump(funds, f)
+
+        print(f"{args.clients} clients in {args.cities} cities, {args.funds} funds\n")
+        print(f"{'representation':<16}{'RSS MB':>10}{'bytes/client':>14}")
+        results = {}
+        for representation in ("dicts", "repository", "search_index", "resident"):
+            output = subprocess.run(
+                [sys.executable, "-m", "bench.memory", "--measure", representation, clients_path, funds_path],
+                cwd=ROOT, capture_output=True, text=True, check=True,
+            ).stdout.split()[-1]
+            results[representation] = int(output)
+            print(f"{representation:<16}{results[representation] / 2**20:>10.1f}{results[representation] / args.clients:>14.0f}")
+        print(f"\nrepository uses {results['dicts'] / max(results['repository'], 1):.1f}x less memory than plain dicts")
+        # the honest comparison for a worker: plain dicts had no search index and no warm caches, the resident set has
+        print(f"resident (repository, search index, funds, warm caches) is {results['resident'] / max(results['dicts'], 1):.2f}x plain dicts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Microbenchmarks for the tool hot path: get_clients, get_funds and call_tool.
+
+    python -m bench.microbench --number 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import timeit
+from types import SimpleNamespace
+
+
+LOW_RISK_CRITERIA = {
+    "risk_level": "Low",
+    "min_rating": 3,
+    "max_expense_ratio": 0.001,
+    "estimated_available_funds": 40000,
+}
+
+
+def tool_call(name, arguments):
+    return SimpleNamespace(
+        id="call_bench",
+        type="function",
+        function=SimpleNamespace(name=name, arguments=json.dumps(arguments)),
+    )
+
+
+def measure(label, func, number, repeat):
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print(f"{label:<40}{best * 1e6:>10.1f} us/call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    os.environ.setdefault("OPENAI_BASE_URL", "http://127.0.0.1:9/v1")
+    import main as app_main
+    from cache import tool_cache
+    from tools import get_clients, get_funds, search_clients
+
+    measure("get_clients(Boston)", lambda: get_clients("Boston"), args.number, args.repeat)
+    measure("get_clients(unknown city)", lambda: get_clients("Nowhere"), args.number, args.repeat)
+    measure("get_funds(low risk)", lambda: get_funds(**LOW_RISK_CRITERIA), args.number, args.repeat)
+    measure("search_clients(trusts 529 plans)", lambda: search_clients("trusts 529 plans"), args.number, args.repeat)
+
+    loop = asyncio.new_event_loop()
+    clients_call = tool_call("get_clients", {"city": "Boston"})
+    funds_call = tool_call("get_funds", LOW_RISK_CRITERIA)
+
+    def call_tool_uncached(call):
+        def run():
+            tool_cache.invalidate()
+            loop.run_until_complete(app_main.call_tool(call))
+        return run
+
+    def call_tool_cached(call):
+        return lambda: loop.run_until_complete(app_main.call_tool(call))
+
+    measure("call_tool(get_clients), cache cold", call_tool_uncached(clients_call), args.number, args.repeat)
+    measure("call_tool(get_clients), cache warm", call_tool_cached(clients_call), args.number, args.repeat)
+    measure("call_tool(get_funds), cache cold", call_tool_uncached(funds_call), args.number, args.repeat)
+    measure("call_tool(get_funds), cache warm", call_tool_cached(funds_call), args.number, args.repeat)
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Local stand-in for the OpenAI chat completions API, for benchmarks and offline runs.
+
+Replies follow a scripted sequence of steps per user turn (tool calls, then a final answer) with configurable
+latency. Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+    python -m bench.mock_openai --port 8900 --script lookup --latency 0.3
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+LOW_RISK_CRITERIA = {
+    "risk_level": "Low",
+    "min_rating": 3,
+    "max_expense_ratio": 0.001,
+    "estimated_available_funds": 40000,
+}
+
+# Each step is either {"tool_calls": [(name, arguments), ...]} or {"content": text}
+SCRIPTS = {
+    "answer": [
+        {"content": "Happy to help. What would you like to know about your clients?"},
+    ],
+    "lookup": [
+        {"tool_calls": [("get_clients", {"city": "Boston"})]},
+        {"tool_calls": [("get_funds", LOW_RISK_CRITERIA)]},
+        {"content": "Lawrence Summers in Boston is close to retirement; the US Large Cap Value Fund and the "
+                    "Emerging Markets Bond Fund fit his low risk profile."},
+    ],
+    "parallel": [
+        {"tool_calls": [("get_clients", {"city": "Boston"}), ("get_clients", {"city": "Chicago"})]},
+        {"content": "You have five clients in Boston and one in Chicago."},
+    ],
+    "repeat": [
+        {"tool_calls": [("get_clients", {"city": "Boston"})]},
+    ] * 5 + [
+        {"content": "Here are your Boston clients."},
+    ],
+}
+
+STEP_ID = re.compile(r"^call_(\d+)_")
+
+
+def current_step(messages):
+    """How far into the script this user turn is, read back from the tool_call_ids we issued"""
+    step = 0
+    for message in messages:
+        if message.get("role") == "user":
+            step = 0
+            continue
+        ids = [message.get("tool_call_id") or ""] + [
+            tool_call.get("id", "") for tool_call in message.get("tool_calls") or []
+        ]
+        for tool_call_id in ids:
+            match = STEP_ID.match(tool_call_id)
+            if match:
+                step = max(step, int(match.group(1)) + 1)
+    return step
+
+
+def create_app(script="lookup", latency=0.0, token_latency=0.0, error_rate=0.0):
+    app = FastAPI()
+    steps = SCRIPTS[script]
+    app.state.requests = 0
+    app.state.prefixes = set()
+
+    def usage(body, completion_tokens):
+        messages = body.get("messages", [])
+        prompt_tokens = (sum(len(json.dumps(message)) for message in messages) + len(json.dumps(body.get("tools")))) // 4
+        # mimic upstream prefix caching: a repeated tools + system prefix is cached in 128-token blocks past 1024
+        prefix = json.dumps(body.get("tools")) + json.dumps(messages[:1])
+        prefix_tokens = (len(prefix) // 4) // 128 * 128
+        cached_tokens = prefix_tokens if prefix in app.state.prefixes and prefix_tokens >= 1024 else 0
+        app.state.prefixes.add(prefix)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        app.state.requests += 1
+        if random.random() < error_rate:
+            # what an overloaded upstream looks like: rate limited or briefly unavailable
+            status = random.choice([429, 503])
+            return JSONResponse(
+                {"error": {"message": "mock overload", "type": "server_error"}},
+                status_code=status,
+                headers={"retry-after": "0.05"} if status == 429 else None,
+            )
+        body = await request.json()
+        messages = body.get("messages", [])
+        index = current_step(messages)
+        step = steps[min(index, len(steps) - 1)]
+        if body.get("tool_choice") == "none" and "tool_calls" in step:
+            step = steps[-1]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        tool_calls = [
+            {
+                "id": f"call_{index}_{position}",
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps(arguments)},
+            }
+            for position, (name, arguments) in enumerate(step.get("tool_calls", []))
+        ]
+        content = step.get("content")
+
+        await asyncio.sleep(latency)
+
+        if not body.get("stream"):
+            message = {"role": "assistant", "content": content}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4o"),
+                "choices": [{
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": "tool_calls" if tool_calls else "stop",
+                }],
+                "usage": usage(body, len((content or "").split()) + 10 * len(tool_calls)),
+            })
+
+        async def events():
+            def chunk(delta, finish_reason=None):
+                return "data: " + json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "gpt-4o"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }) + "\n\n"
+
+            yield chunk({"role": "assistant"})
+            for word in (content or "").split(" ") if content else []:
+                await asyncio.sleep(token_latency)
+                yield chunk({"content": word + " "})
+            for position, tool_call in enumerate(tool_calls):
+                arguments = tool_call["function"]["arguments"]
+                half = len(arguments) // 2
+                # split the arguments across two chunks, like the real API does
+                yield chunk({"tool_calls": [{
+                    "index": position,
+                    "id": tool_call["id"],
+                    "type": "function",
+                    "function": {"name": tool_call["function"]["name"], "arguments": arguments[:half]},
+                }]})
+                yield chunk({"tool_calls": [{"index": position, "function": {"arguments": arguments[half:]}}]})
+            yield chunk({}, finish_reason="tool_calls" if tool_calls else "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield "data: " + json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "gpt-4o"),
+                    "choices": [],
+                    "usage": usage(body, len((content or "").split()) + 10 * len(tool_calls)),
+                }) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--script", choices=sorted(SCRIPTS), default="lookup")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each response starts")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429/503")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(
+        create_app(args.script, args.latency, args.token_latency, args.error_rate),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
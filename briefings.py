@@ -0,0 +1,221 @@
+"""Meeting briefings for a whole book of clients.
+
+The rule-6 checks from the advisor prompt (missing estate documents, negative portfolio performance, retirement
+within five years) run deterministically over the client repository; the model is only asked for the narrative.
+
+    python -m briefings --city Boston --output briefings.jsonl [--no-narrative] [--concurrency 4]
+
+Re-running with the same --output skips clients that already have a finished briefing in the file.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from client_repository import DEFAULT_RETIREMENT_AGE
+from datasets import datasets
+from observability import get_logger, log_event, span
+
+
+logger = get_logger("briefings")
+
+RETIREMENT_REVIEW_YEARS = 5
+
+ESTATE_DOCUMENTS = re.compile(r"\b(wills|living will|trusts?|power of attorney|estate plan\w*)\b", re.IGNORECASE)
+DECLINE = re.compile(
+    r"(?:(\d+(?:\.\d+)?)\s*(?:%|percent)\s+(?:decline|drop|decrease|loss|fall))"
+    r"|(?:(?:decline|drop|decrease|loss|fall)\s+of\s+(?:over\s+|about\s+)?(\d+(?:\.\d+)?)\s*(?:%|percent))",
+    re.IGNORECASE,
+)
+YEARS_FROM_RETIREMENT = re.compile(r"(\d+)\s+years?\s+(?:from|away from|until|to)\s+retirement", re.IGNORECASE)
+
+Narrator = Callable[[Dict, List[Dict]], Awaitable[str]]
+
+
+def client_text(client: Dict) -> str:
+    return f"{client.get('details') or ''}\n{client.get('meeting_notes') or ''}"
+
+
+def sentence_around(text: str, start: int) -> str:
+    begin = max(text.rfind(". ", 0, start) + 2, text.rfind("\n", 0, start) + 1, 0)
+    end = text.find(".", start)
+    return text[begin:end + 1 if end != -1 else len(text)].strip()
+
+
+def check_estate_documents(client: Dict) -> Dict:
+    """Rule 6a: no mention of wills, trusts or power of attorney means the file may be incomplete"""
+    match = ESTATE_DOCUMENTS.search(client_text(client))
+    return {
+        "check": "estate_documents",
+        "flagged": match is None,
+        "evidence": sentence_around(client_text(client), match.start()) if match else None,
+    }
+
+
+def check_negative_performance(client: Dict) -> Dict:
+    """Rule 6b: a reported decline in the portfolio, with the figure to cite"""
+    text = client_text(client)
+    match = DECLINE.search(text)
+    return {
+        "check": "negative_performance",
+        "flagged": match is not None,
+        "decline_percent": float(match.group(1) or match.group(2)) if match else None,
+        "evidence": sentence_around(text, match.start()) if match else None,
+    }
+
+
+def check_retirement_horizon(client: Dict) -> Dict:
+    """Rule 6c: planned retirement less than five years away"""
+    stated = YEARS_FROM_RETIREMENT.search(client_text(client))
+    if stated:
+        years, source = int(stated.group(1)), "details"
+    elif client.get("age") is not None:
+        years = client.get("retirement_age", DEFAULT_RETIREMENT_AGE) - client["age"]
+        source = "age"
+    else:
+        years, source = None, None
+    return {
+        "check": "retirement_horizon",
+        "flagged": years is not None and years < RETIREMENT_REVIEW_YEARS,
+        "years_to_retirement": years,
+        "source": source,
+    }
+
+
+CHECKS = (check_estate_documents, check_negative_performance, check_retirement_horizon)
+
+
+def run_checks(client: Dict) -> List[Dict]:
+    return [check(client) for check in CHECKS]
+
+
+def select_clients(
+    cities: Optional[Iterable[str]] = None, names: Optional[Iterable[str]] = None, limit: Optional[int] = None
+) -> List[Dict]:
+    """Clients in the given cities (all cities by default), optionally only those with the given names.
+
+    With limit, stops once that many clients are selected.
+
+    Each item carries the repository's client id, which briefings are keyed by: two clients sharing a name in
+    a city still get a briefing each, and a resumed run recognises the ones already written.
+    """
+    wanted = {name.lower() for name in names} if names else None
+    clients = datasets.snapshot().clients
+    selected = []
+    for city in cities or clients.cities():
+        for _, client_id, _, client in clients.records(city=city):
+            if wanted is None or (client.get("name") or "").lower() in wanted:
+                selected.append({"client_id": client_id, "city": city, "client": client})
+                if limit is not None and len(selected) >= limit:
+                    return selected
+    return selected
+
+
+def finished_keys(path: str, need_narrative: bool = False) -> Set[str]:
+    """Keys of the briefings already completed in an earlier run's output"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short when the previous run was interrupted
+            if record.get("status") == "ok" and (record.get("narrative") or not need_narrative):
+                done.add(record["key"])
+    return done
+
+
+async def build_briefing(client_id: str, city: str, client: Dict, narrator: Optional[Narrator]) -> Dict:
+    findings = run_checks(client)
+    record = {
+        "key": client_id,
+        "city": city,
+        "name": client.get("name"),
+        "email": client.get("email"),
+        "findings": findings,
+        "topics": [finding["check"] for finding in findings if finding["flagged"]],
+        "narrative": None,
+        "status": "ok",
+    }
+    if narrator is not None:
+        try:
+            with span("briefing_narrative"):
+                record["narrative"] = await narrator(client, findings)
+        except Exception as e:
+            # the deterministic findings still stand; the next run retries the narrative
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+async def iter_briefings(items: List[Dict], narrator: Optional[Narrator] = None, concurrency: int = 4):
+    """Briefings for select_clients() items, yielded in completion order with at most concurrency narratives in flight.
+
+    Closing the generator early (a consumer that stops reading, or a client that disconnects) cancels the
+    briefings still pending, so no narrative is requested for nobody.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def brief(item):
+        async with semaphore:
+            return await build_briefing(item["client_id"], item["city"], item["client"], narrator)
+
+    tasks = [asyncio.ensure_future(brief(item)) for item in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_briefings(
+    output_path: str,
+    cities: Optional[Iterable[str]] = None,
+    names: Optional[Iterable[str]] = None,
+    narrator: Optional[Narrator] = None,
+    concurrency: int = 4,
+) -> Dict[str, int]:
+    """Append one JSON line per client to output_path as each briefing completes, skipping finished ones"""
+    done = finished_keys(output_path, need_narrative=narrator is not None)
+    pending = [item for item in select_clients(cities, names) if item["client_id"] not in done]
+    counts = {"skipped": len(done), "ok": 0, "error": 0}
+    records = iter_briefings(pending, narrator, concurrency)
+    try:
+        with open(output_path, "a") as output:
+            async for record in records:
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                counts[record["status"]] += 1
+    finally:
+        await records.aclose()
+
+    log_event(logger, logging.INFO, "briefings_written", path=output_path, **counts)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--city", action="append", dest="cities", help="repeatable; all cities by default")
+    parser.add_argument("--client", action="append", dest="names", help="repeatable; only these client names")
+    parser.add_argument("--output", default="briefings.jsonl")
+    parser.add_argument("--concurrency", type=int, default=4, help="narratives requested from the model at once")
+    parser.add_argument("--no-narrative", action="store_true", help="only run the deterministic checks")
+    args = parser.parse_args()
+
+    narrator = None
+    if not args.no_narrative:
+        from main import narrate_briefing
+        narrator = narrate_briefing
+    counts = asyncio.run(run_briefings(args.output, args.cities, args.names, narrator, args.concurrency))
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
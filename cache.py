@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+# Read-only tools whose results depend only on their arguments. Anything with side effects
+# (send_email_gmail) or reading changing state (get_email_status) must never be listed here.
+CACHEABLE_TOOLS = {"get_clients", "get_clients_bulk", "search_clients", "get_funds", "get_funds_bulk"}
+CLIENT_DATA_TOOLS = {"get_clients", "get_clients_bulk", "search_clients"}
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ttl_seconds after being stored"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, predicate: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """Drop every entry (or those whose key matches predicate), returning how many were dropped"""
+        with self._lock:
+            if predicate is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+                return dropped
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+tool_cache = TTLCache(
+    max_entries=int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024")),
+    ttl_seconds=float(os.getenv("TOOL_CACHE_TTL_SECONDS", "300")),
+)
+
+# Off unless COMPLETION_CACHE_ENABLED=true: replaying completions is only sound because the model runs at temperature 0
+completion_cache = TTLCache(
+    max_entries=int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "256")),
+    ttl_seconds=float(os.getenv("COMPLETION_CACHE_TTL_SECONDS", "600")),
+)
+completion_cache_enabled = os.getenv("COMPLETION_CACHE_ENABLED", "false").lower() == "true"
+
+
+def tool_cache_key(function_name: str, arguments: Dict, data_version: int = 0) -> Optional[tuple]:
+    """Key for a read-only tool call, normalized so argument order and omitted optionals don't matter; None if uncacheable.
+
+    data_version is the dataset snapshot the result is read from, so a reload never serves results of the old data.
+    """
+    if function_name not in CACHEABLE_TOOLS:
+        return None
+    normalized = {name: value for name, value in arguments.items() if value is not None}
+    return (function_name, json.dumps(normalized, sort_keys=True), data_version)
+
+
+def completion_cache_key(messages, settings: Dict) -> str:
+    """Hash of everything that determines a completion: the system prompt and history as sent, plus the model settings"""
+    payload = json.dumps({"messages": messages, "settings": settings}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def invalidate_client_data() -> Dict[str, int]:
+    """Forget everything derived from the client book; call this whenever client data changes"""
+    from datasets import datasets
+
+    datasets.snapshot().clients.invalidate()
+    return {
+        "tool_results": tool_cache.invalidate(lambda key: key[0] in CLIENT_DATA_TOOLS),
+        # completions may quote client data anywhere, so they all go
+        "completions": completion_cache.invalidate(),
+    }
+
+
+def invalidate_dataset_results() -> Dict[str, int]:
+    """Forget every tool result and completion read from an older dataset snapshot"""
+    return {"tool_results": tool_cache.invalidate(), "completions": completion_cache.invalidate()}
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        "tool_results": tool_cache.stats(),
+        "completions": {**completion_cache.stats(), "enabled": completion_cache_enabled},
+    }
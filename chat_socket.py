@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import AsyncIterator, Callable, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from observability import Counter, get_logger, log_event, registry
+
+
+logger = get_logger("chat_socket")
+
+# Turns one connection may have in flight at once, across all of its sessions
+SOCKET_MAX_TURNS = int(os.getenv("SOCKET_MAX_TURNS", "4"))
+
+socket_turns = registry.register(Counter(
+    "advisor_socket_turns_total", "Chat turns run over the WebSocket transport, by how they ended", ("outcome",),
+))
+
+TurnRunner = Callable[[dict], AsyncIterator[dict]]
+
+
+class ChatConnection:
+    """One browser's WebSocket, carrying chat turns for any number of sessions at once.
+
+    Client frames:
+        {"type": "chat", "turn_id": ..., "session_id": ..., "message": ..., ...}  same body as /chat
+        {"type": "cancel", "turn_id": ...}
+        {"type": "ping"}
+    Every server frame carries the turn_id it belongs to: "started" (with the session_id), then the /chat/stream
+    events ("delta", "tool_call", "tool_result"), and finally "done", "error" or "cancelled". A cancelled turn
+    stops where it is, including any upstream call in flight, and leaves the stored session unchanged.
+
+    CORS does not apply to WebSockets, so the handshake is refused (1008) unless its Origin is one of
+    allowed_origins or the app's own; requests without an Origin header do not come from a browser page.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        run_turn: TurnRunner,
+        allowed_origins: Iterable[str] = (),
+        max_turns: int = SOCKET_MAX_TURNS,
+    ):
+        self.websocket = websocket
+        self.run_turn = run_turn
+        self.allowed_origins = {origin.rstrip("/") for origin in allowed_origins}
+        self.max_turns = max_turns
+        self.turns: Dict[str, asyncio.Task] = {}
+        self.busy_sessions: Dict[str, str] = {}  # session_id -> turn_id, so a session runs one turn at a time
+        self._send_lock = asyncio.Lock()
+        self._closed = False
+
+    async def send(self, frame: dict) -> None:
+        if self._closed:
+            return
+        async with self._send_lock:
+            try:
+                await self.websocket.send_json(frame)
+            except (WebSocketDisconnect, RuntimeError):
+                self._closed = True
+
+    def origin_allowed(self) -> bool:
+        origin = self.websocket.headers.get("origin")
+        if origin is None:
+            return True
+        origin = origin.rstrip("/")
+        return origin in self.allowed_origins or urlsplit(origin).netloc == self.websocket.headers.get("host")
+
+    async def serve(self) -> None:
+        if not self.origin_allowed():
+            log_event(logger, logging.WARNING, "socket_origin_rejected", origin=self.websocket.headers.get("origin"))
+            await self.websocket.close(code=1008)
+            return
+        await self.websocket.accept()
+        try:
+            while True:
+                try:
+                    frame = json.loads(await self.websocket.receive_text())
+                except (ValueError, KeyError):  # KeyError: a binary frame has no text
+                    frame = None
+                if not isinstance(frame, dict):
+                    # a bad frame is the sender's problem; the other turns on this connection carry on
+                    await self.send({"type": "error", "error": "frames must be JSON objects"})
+                    continue
+                await self.handle(frame)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._closed = True
+            # nobody is listening any more, so nothing in flight should keep calling the model
+            for task in list(self.turns.values()):
+                task.cancel()
+            await asyncio.gather(*self.turns.values(), return_exceptions=True)
+
+    async def handle(self, frame: dict) -> None:
+        kind = frame.get("type")
+        turn_id = str(frame.get("turn_id") or uuid.uuid4().hex)
+        if kind == "chat":
+            await self.start(turn_id, frame)
+        elif kind == "cancel":
+            task = self.turns.get(turn_id)
+            if task is None:
+                await self.send({"type": "error", "turn_id": turn_id, "error": "no such turn in flight"})
+            else:
+                task.cancel()
+        elif kind == "ping":
+            await self.send({"type": "pong"})
+        else:
+            await self.send({"type": "error", "turn_id": turn_id, "error": f"unknown frame type {kind!r}"})
+
+    async def start(self, turn_id: str, data: dict) -> None:
+        session_id: Optional[str] = data.get("session_id")
+        if turn_id in self.turns:
+            error = "a turn with this turn_id is already in flight"
+        elif session_id and session_id in self.busy_sessions:
+            error = "this session already has a turn in flight"
+        elif len(self.turns) >= self.max_turns:
+            error = f"at most {self.max_turns} turns can be in flight per connection"
+        else:
+            error = None
+        if error:
+            await self.send({"type": "error", "turn_id": turn_id, "error": error})
+            return
+        if session_id:
+            self.busy_sessions[session_id] = turn_id
+        self.turns[turn_id] = asyncio.create_task(self._run(turn_id, session_id, data))
+
+    async def _run(self, turn_id: str, session_id: Optional[str], data: dict) -> None:
+        outcome = "error"
+        try:
+            async for event in self.run_turn(data):
+                if event["type"] in ("done", "error"):
+                    outcome = event["type"]
+                await self.send({**event, "turn_id": turn_id})
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            log_event(logger, logging.INFO, "turn_cancelled", turn_id=turn_id)
+            await self.send({"type": "cancelled", "turn_id": turn_id})
+        except Exception as e:
+            logger.exception("Chat turn failed")
+            await self.send({"type": "error", "turn_id": turn_id, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            socket_turns.inc(outcome=outcome)
+            self.turns.pop(turn_id, None)
+            if session_id and self.busy_sessions.get(session_id) == turn_id:
+                del self.busy_sessions[session_id]
@@ -0,0 +1,416 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from json.encoder import encode_basestring_ascii as encode_string  # what json.dumps uses for a str
+from typing import Dict, List, Optional
+
+
+CLIENTS_PATH = os.getenv("CLIENTS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "clients.json"))
+# Most serialized JSON the query cache keeps, whatever its entry count
+CLIENT_CACHE_MB = float(os.getenv("CLIENT_CACHE_MB", "16"))
+
+# The book has no planned retirement age per client yet, so the retirement horizon assumes this one
+DEFAULT_RETIREMENT_AGE = 65
+
+
+# Fields kept in their own columns, in the order the book lists them; anything else goes to the extra column
+CLIENT_FIELDS = (
+    "name", "email", "age", "profession", "affiliation", "invested_assets", "last_contacted_days",
+    "risk_profile", "estimated_available_funds", "details", "meeting_notes",
+)
+# Low-cardinality fields are stored as codes into one table of distinct values, each value held once
+CATEGORICAL_FIELDS = ("profession", "affiliation", "risk_profile")
+# Long free text is kept deflate-compressed and only inflated when a query serializes the record
+FREE_TEXT_FIELDS = ("details", "meeting_notes")
+MIN_COMPRESS_CHARS = 128
+PLAIN, CATEGORICAL, FREE_TEXT, EXTRA = range(4)
+FIELD_KINDS = {
+    field: CATEGORICAL if field in CATEGORICAL_FIELDS else FREE_TEXT if field in FREE_TEXT_FIELDS else PLAIN
+    for field in CLIENT_FIELDS
+}
+RECORD_COLUMNS = ", ".join(("layout",) + CLIENT_FIELDS + ("extra",))
+
+
+def pack_text(value):
+    """Raw-deflate a long string (stored as a BLOB); short strings and non-strings are stored as they are"""
+    if not isinstance(value, str) or len(value) < MIN_COMPRESS_CHARS:
+        return value
+    packed = zlib.compress(value.encode(), 9)[2:-4]  # strip the zlib header and checksum
+    return packed if len(packed) < len(value) else value
+
+
+def unpack_text(value):
+    return zlib.decompress(value, -zlib.MAX_WBITS).decode() if isinstance(value, bytes) else value
+
+
+class ClientRepository:
+    """Client book loaded once into SQLite, indexed on the fields the advisor filters by.
+
+    Every field has its own column (categorical ones as small integer codes, long free text deflated) instead of
+    one dict or JSON document per client, which keeps a large book a fraction of its size as Python objects. Records are turned
+    back into JSON only when a query needs them, and each distinct query's payload (per requested field set) is
+    cached (up to cache_entries of them, and cache_bytes of JSON in all) until invalidate() is called.
+    """
+
+    def __init__(self, db_path: str = ":memory:", cache_entries: int = 512, cache_bytes: int = int(CLIENT_CACHE_MB * 2**20)):
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        # larger pages mean less per-page overhead for a table that is read mostly in full rows
+        self._conn.execute("PRAGMA page_size = 16384")
+        self._lock = threading.RLock()
+        self._cache = OrderedDict()  # key -> (payload, size)
+        self.cache_entries = cache_entries
+        self.cache_bytes = cache_bytes
+        self._cached_bytes = 0
+        # columns without a declared type keep every value exactly as loaded (an int stays an int)
+        self._conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS clients (
+                id INTEGER PRIMARY KEY,
+                client_id TEXT NOT NULL,
+                city TEXT NOT NULL,
+                layout INTEGER NOT NULL,
+                {", ".join(f"{field} INTEGER" if field in CATEGORICAL_FIELDS else field for field in CLIENT_FIELDS)},
+                extra TEXT,
+                years_to_retirement INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS clients_city ON clients (city);
+            CREATE INDEX IF NOT EXISTS clients_risk_profile ON clients (risk_profile);
+            CREATE INDEX IF NOT EXISTS clients_last_contacted_days ON clients (last_contacted_days);
+            CREATE INDEX IF NOT EXISTS clients_years_to_retirement ON clients (years_to_retirement);
+            """
+        )
+        self._reset_codes()
+
+    def _reset_codes(self) -> None:
+        self._category_codes: Dict[str, int] = {}  # JSON of a categorical value -> code
+        self._category_json: List[str] = []  # code -> JSON of the value
+        self._layout_codes: Dict[tuple, int] = {}
+        # code -> (pre-encoded '"key": ', row position or key of an extra field, kind) in the record's own order
+        self._layouts: List[tuple] = []
+        self._layout_keys: List[tuple] = []
+        self._projections: Dict[tuple, tuple] = {}  # (layout, fields) -> plan for only those fields
+
+    def _code(self, value) -> Optional[int]:
+        if value is None:
+            return None
+        encoded = json.dumps(value)
+        code = self._category_codes.get(encoded)
+        if code is None:
+            code = self._category_codes[encoded] = len(self._category_json)
+            self._category_json.append(encoded)
+        return code
+
+    def _column_value(self, field: str, value):
+        if field in CATEGORICAL_FIELDS:
+            return self._code(value)
+        if field in FREE_TEXT_FIELDS:
+            return pack_text(value)
+        return value
+
+    def _layout(self, keys: tuple) -> int:
+        code = self._layout_codes.get(keys)
+        if code is None:
+            code = self._layout_codes[keys] = len(self._layouts)
+            self._layout_keys.append(keys)
+            self._layouts.append(tuple(
+                (json.dumps(key) + ": ", CLIENT_FIELDS.index(key) + 1, FIELD_KINDS[key])
+                if key in FIELD_KINDS else (json.dumps(key) + ": ", key, EXTRA)
+                for key in keys
+            ))
+        return code
+
+    @classmethod
+    def from_json_file(cls, path: str = CLIENTS_PATH, db_path: str = ":memory:") -> "ClientRepository":
+        """Load a {city: [client, ...]} JSON file"""
+        with open(path) as f:
+            database = json.load(f)
+        repository = cls(db_path)
+        repository.load(database, consume=True)
+        return repository
+
+    def load(self, database: Dict[str, List[Dict]], consume: bool = False) -> None:
+        """Replace the whole book with a {city: [client, ...]} mapping.
+
+        With consume=True each city's records are dropped from the mapping once inserted, so the parsed JSON is
+        freed while the table grows instead of all at the end.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM clients")
+            self._reset_codes()
+            for city in list(database):
+                clients = database.pop(city) if consume else database[city]
+                rows = []
+                occurrences = {}
+                for client in clients:
+                    client_id = f"{city}/{client.get('name')}"
+                    occurrences[client_id] = occurrences.get(client_id, 0) + 1
+                    if occurrences[client_id] > 1:
+                        client_id = f"{client_id}#{occurrences[client_id]}"
+                    age = client.get("age")
+                    retirement_age = client.get("retirement_age", DEFAULT_RETIREMENT_AGE)
+                    extra = {key: value for key, value in client.items() if key not in CLIENT_FIELDS}
+                    rows.append((
+                        client_id,
+                        city,
+                        self._layout(tuple(client)),
+                        *(self._column_value(field, client.get(field)) for field in CLIENT_FIELDS),
+                        json.dumps(extra) if extra else None,
+                        retirement_age - age if age is not None else None,
+                    ))
+                self._conn.executemany(
+                    f"INSERT INTO clients (client_id, city, layout, {', '.join(CLIENT_FIELDS)}, extra, years_to_retirement) "
+                    f"VALUES ({', '.join('?' for _ in range(len(CLIENT_FIELDS) + 5))})",
+                    rows,
+                )
+            self._conn.commit()
+            self.invalidate()
+
+    def _plan(self, layout: int, fields: Optional[frozenset]) -> tuple:
+        """The layout's serialization plan, cut down to the requested fields and kept for the next record like it"""
+        if fields is None:
+            return self._layouts[layout]
+        plan = self._projections.get((layout, fields))
+        if plan is None:
+            plan = self._projections[(layout, fields)] = tuple(
+                step for step, key in zip(self._layouts[layout], self._layout_keys[layout]) if key in fields
+            )
+        return plan
+
+    def _record_json(self, row, fields: Optional[frozenset] = None) -> str:
+        """One client as JSON, keys in the order the book had them, from a (layout, *CLIENT_FIELDS, extra) row"""
+        extra = None
+        parts = []
+        for encoded_key, position, kind in self._plan(row[0], fields):
+            if kind == EXTRA:
+                if extra is None:
+                    extra = json.loads(row[-1])
+                value = extra[position]
+            else:
+                value = row[position]
+                if kind == CATEGORICAL and value is not None:
+                    parts.append(encoded_key + self._category_json[value])
+                    continue
+                if kind == FREE_TEXT:
+                    value = unpack_text(value)
+            parts.append(encoded_key + (encode_string(value) if type(value) is str else json.dumps(value)))
+        return "{" + ", ".join(parts) + "}"
+
+    def _filter_code(self, value) -> Optional[int]:
+        """Code to filter a categorical column by; -1 (matches nothing) for a value the book does not have"""
+        if value is None:
+            return None
+        return self._category_codes.get(json.dumps(value), -1)
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        self._cache.move_to_end(key)
+        return entry[0]
+
+    def _remember(self, key, payload) -> None:
+        """Cache a payload (a JSON string or a list of them), evicting the least recently used past either limit"""
+        size = len(payload) if isinstance(payload, str) else sum(len(record) for record in payload)
+        if size > self.cache_bytes:
+            return
+        previous = self._cache.pop(key, None)
+        if previous is not None:
+            self._cached_bytes -= previous[1]
+        self._cache[key] = (payload, size)
+        self._cached_bytes += size
+        while len(self._cache) > self.cache_entries or self._cached_bytes > self.cache_bytes:
+            _, (_, evicted) = self._cache.popitem(last=False)
+            self._cached_bytes -= evicted
+
+    def cache_usage(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._cache), "bytes": self._cached_bytes}
+
+    def hot_queries(self) -> List[tuple]:
+        """(cache key, bytes) of every cached query, least recently used first, to warm() another repository with"""
+        with self._lock:
+            return [(key, size) for key, (_, size) in self._cache.items()]
+
+    def warm(self, queries: Optional[List[tuple]] = None) -> int:
+        """Run queries ahead of the requests that will ask for them; returns how many ran.
+
+        queries is another repository's hot_queries(): the most recently used ones that fit this cache's budget
+        are replayed, oldest first so the hottest stay cached longest. By default each city's client list is
+        serialized until the cache is full.
+        """
+        if queries is None:
+            queries = [(("json", None, ("city", city)), 0) for city in self.cities()]
+        else:
+            budget, fitting = self.cache_bytes, []
+            for key, size in reversed(queries):
+                if size > budget:
+                    break
+                budget -= size
+                fitting.append((key, size))
+            queries = fitting[::-1]
+        ran = 0
+        for (kind, *arguments), _ in queries:
+            if self._cached_bytes >= self.cache_bytes:
+                break
+            if kind == "json" or kind == "records":
+                fields, *filters = arguments
+                (self.query_json if kind == "json" else self.records_json)(fields, **dict(filters))
+            elif kind == "cities":
+                cities, risk_profile, max_last_contacted_days, fields = arguments
+                self.query_cities_json(list(cities), risk_profile, max_last_contacted_days, fields)
+            ran += 1
+        return ran
+
+    def invalidate(self) -> None:
+        """Drop the cached query payloads, e.g. after the underlying client data changed"""
+        with self._lock:
+            self._cache.clear()
+            self._cached_bytes = 0
+
+    def _select(
+        self,
+        city: Optional[str] = None,
+        risk_profile: Optional[str] = None,
+        max_last_contacted_days: Optional[int] = None,
+        min_last_contacted_days: Optional[int] = None,
+        max_years_to_retirement: Optional[int] = None,
+        fields: Optional[frozenset] = None,
+    ) -> List[str]:
+        clauses, params = [], []
+        for clause, value in (
+            ("city = ?", city),
+            ("risk_profile = ?", self._filter_code(risk_profile)),
+            ("last_contacted_days <= ?", max_last_contacted_days),
+            ("last_contacted_days >= ?", min_last_contacted_days),
+            ("years_to_retirement <= ?", max_years_to_retirement),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn.execute(f"SELECT {RECORD_COLUMNS} FROM clients {where} ORDER BY id", params).fetchall()
+        return [self._record_json(row, fields) for row in rows]
+
+    @staticmethod
+    def _records_key(fields: Optional[frozenset], filters: Dict) -> tuple:
+        return ("records", fields, *sorted((name, value) for name, value in filters.items() if value is not None))
+
+    def records_json(self, fields: Optional[frozenset] = None, **filters) -> List[str]:
+        """Clients matching every given filter (city, risk_profile, max_/min_last_contacted_days,
+        max_years_to_retirement), each serialized with only the requested fields (all by default).
+
+        The list is cached per query and projection, so paging through it only slices already-serialized records.
+        """
+        key = self._records_key(fields, filters)
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+            records = self._select(fields=fields, **filters)
+            self._remember(key, records)
+            return records
+
+    def query_json(self, fields: Optional[frozenset] = None, **filters) -> str:
+        """Clients matching every given filter, as the JSON array the tools return.
+
+        Only the joined array is cached, not the record list behind it too, so a query is held in memory once.
+        """
+        key = ("json", fields, *sorted(filters.items()))
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+            records = self._cached(self._records_key(fields, filters)) or self._select(fields=fields, **filters)
+            payload = "[" + ", ".join(records) + "]"
+            self._remember(key, payload)
+            return payload
+
+    def query_cities_json(
+        self,
+        cities: List[str],
+        risk_profile: Optional[str] = None,
+        max_last_contacted_days: Optional[int] = None,
+        fields: Optional[frozenset] = None,
+    ) -> str:
+        """Clients for several cities from one indexed lookup, as a JSON object of {city: [client, ...]}"""
+        cities = list(dict.fromkeys(city for city in cities if city))
+        key = ("cities", tuple(cities), risk_profile, max_last_contacted_days, fields)
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+
+            clauses = [f"city IN ({', '.join('?' for _ in cities)})"]
+            params = list(cities)
+            if risk_profile is not None:
+                clauses.append("risk_profile = ?")
+                params.append(self._filter_code(risk_profile))
+            if max_last_contacted_days is not None:
+                clauses.append("last_contacted_days <= ?")
+                params.append(max_last_contacted_days)
+            rows = self._conn.execute(
+                f"SELECT city, {RECORD_COLUMNS} FROM clients WHERE {' AND '.join(clauses)} ORDER BY id", params
+            ).fetchall()
+            by_city = {city: [] for city in cities}
+            for row in rows:
+                by_city[row[0]].append(self._record_json(row[1:], fields))
+            payload = "{" + ", ".join(
+                f"{json.dumps(city)}: [{', '.join(records)}]" for city, records in by_city.items()
+            ) + "}"
+            self._remember(key, payload)
+            return payload
+
+    def query(self, **filters) -> List[Dict]:
+        return json.loads(self.query_json(**filters))
+
+    def by_city(self, city: str) -> str:
+        return self.query_json(city=city)
+
+    def records(self, city: Optional[str] = None, batch_size: int = 1000):
+        """(row id, client id, city, client) for every client in the book (or one city), in load order.
+
+        The row id numbers the client within this repository only (see by_ids); the client id is
+        "city/name", with "#2", "#3"... for later clients of the same name in a city, and stays the same for a
+        client across reloads of the book. Rows are read a batch at a time, so a caller walking the whole
+        book neither holds the lock throughout nor has every client parsed at once.
+        """
+        last = 0
+        where = "AND city = ?" if city is not None else ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT id, client_id, city, {RECORD_COLUMNS} FROM clients WHERE id > ? {where} ORDER BY id LIMIT ?",
+                    (last, city, batch_size) if city is not None else (last, batch_size),
+                ).fetchall()
+                batch = [(row[0], row[1], row[2], json.loads(self._record_json(row[3:]))) for row in rows]
+            yield from batch
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][0]
+
+    def by_ids(self, ids: List[int]) -> Dict[int, tuple]:
+        """{id: (city, client)} for the given row ids, as records() numbers them"""
+        ids = list(ids)
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, city, {RECORD_COLUMNS} FROM clients WHERE id IN ({', '.join('?' for _ in ids)})", ids
+            ).fetchall()
+            return {row[0]: (row[1], json.loads(self._record_json(row[2:]))) for row in rows}
+
+    def by_name(self, name: str) -> List[tuple]:
+        """(city, client) for every client with this name, ignoring case"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT city, {RECORD_COLUMNS} FROM clients WHERE name = ? COLLATE NOCASE ORDER BY id", (name,)
+            ).fetchall()
+            return [(row[0], json.loads(self._record_json(row[1:]))) for row in rows]
+
+    def cities(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT city FROM clients ORDER BY city")]
+
@@ -0,0 +1,311 @@
+import hashlib
+import json
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from client_repository import ClientRepository
+
+
+TOKEN = re.compile(r"[a-z0-9]+(?:\([a-z0-9]+\))?")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have he her his in is it its of on or she that the their they this "
+    "to was were which who with about asked any client clients".split()
+)
+# Fields searched, with how much a match in each counts
+SEARCH_FIELDS = {"meeting_notes": 1.0, "details": 1.0, "profession": 0.5, "affiliation": 0.5, "name": 2.0}
+SNIPPET_FIELDS = ("meeting_notes", "details")
+SENTENCE = re.compile(r"[^.!?]+[.!?]?")
+MAX_SNIPPET_CHARS = 240
+
+
+def normalize(token: str) -> str:
+    """Lowercased token with 401(k) kept whole and a plural s dropped (trusts -> trust, plans -> plan)"""
+    token = token.replace("(", "").replace(")", "")
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss") and not token.isdigit():
+        token = token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [normalize(token) for token in TOKEN.findall((text or "").lower()) if token not in STOPWORDS]
+
+
+# Doc-id columns kept per indexed client; age and last contact use MISSING where the book has no value
+MISSING = -1
+DOCUMENT_COLUMNS = (
+    ("_rows", "I"), ("_fingerprints", "Q"), ("_lengths", "f"), ("_alive", "B"),
+    ("_city_codes", "I"), ("_risk_codes", "I"), ("_ages", "i"), ("_last_contacted", "i"),
+)
+
+
+# A posting is one uint32: the doc id in the high 24 bits and the weighted term frequency in half units in the low 8.
+# Field weights are multiples of 0.5, so the frequency is exact up to the cap, well past where BM25 saturates.
+WEIGHT_BITS = 8
+WEIGHT_MASK = (1 << WEIGHT_BITS) - 1
+MAX_DOCS = 1 << (32 - WEIGHT_BITS)
+
+
+def posting(doc: int, frequency: float) -> int:
+    return doc << WEIGHT_BITS | min(int(round(frequency * 2)), WEIGHT_MASK)
+
+
+def packed(postings: Union[int, array]) -> np.ndarray:
+    """A term's postings as a uint32 array; a term found in one document holds its single posting as an int"""
+    if isinstance(postings, int):
+        return np.array([postings], dtype=np.uint32)
+    return np.frombuffer(postings, dtype=np.uint32)
+
+
+def fingerprint(client: Dict) -> int:
+    return int.from_bytes(hashlib.blake2b(json.dumps(client, sort_keys=True).encode(), digest_size=8).digest(), "little")
+
+
+def whole_number(value) -> int:
+    return value if isinstance(value, int) and not isinstance(value, bool) and 0 <= value < 2**31 else MISSING
+
+
+class ClientSearchIndex:
+    """In-memory inverted index over the client book, ranked with BM25.
+
+    Each client gets an integer doc id; a term's postings are one array of packed doc ids and weighted term
+    frequencies (see posting) and the filter fields are columns indexed by doc id, so the index holds no Python
+    object per client or per posting, and scoring runs over the arrays with NumPy. Names, emails and snippet text are read
+    from the repository for the top results only.
+
+    Documents are keyed by the repository's client id. sync() re-indexes only the clients whose record changed since the
+    last sync, so reloading the book does not rebuild the whole index.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self.repository: Optional[ClientRepository] = None  # where results' records are read from
+        self._reset()
+
+    def _reset(self) -> None:
+        self._term_ids: Dict[str, int] = {}
+        self._postings: List[Union[int, array]] = []  # term id -> packed postings in doc id order (see packed)
+        self._owned = set()  # term ids whose arrays this index may append to; the rest may be shared with a fork
+        self._doc_ids: Dict[str, int] = {}  # client id -> doc id of the live document
+        for name, typecode in DOCUMENT_COLUMNS:
+            setattr(self, name, array(typecode))
+        self._cities: Dict[str, int] = {}  # lowercased value -> code, for the filter columns
+        self._risks: Dict[str, int] = {}
+        self._total_length = 0.0
+
+    @classmethod
+    def from_repository(cls, repository: ClientRepository) -> "ClientSearchIndex":
+        index = cls()
+        index.sync(repository)
+        return index
+
+    def fork(self) -> "ClientSearchIndex":
+        """A copy to sync() while this index keeps serving.
+
+        Postings arrays are shared and copied only when the fork adds to a term; removals build new arrays. The
+        doc-id columns and the key and term maps are copied, which is a small fraction of the index.
+        """
+        index = ClientSearchIndex(self.k1, self.b)
+        with self._lock:
+            index.repository = self.repository
+            index._term_ids = dict(self._term_ids)
+            index._postings = list(self._postings)
+            self._owned = set()  # both sides now copy a shared term's arrays before appending to them
+            index._doc_ids = dict(self._doc_ids)
+            for name, _ in DOCUMENT_COLUMNS:
+                setattr(index, name, array(getattr(self, name).typecode, getattr(self, name)))
+            index._cities = dict(self._cities)
+            index._risks = dict(self._risks)
+            index._total_length = self._total_length
+        return index
+
+    def __len__(self) -> int:
+        return len(self._doc_ids)
+
+    def _terms(self, client: Dict) -> Counter:
+        terms = Counter()
+        for field, weight in SEARCH_FIELDS.items():
+            value = client.get(field)
+            if isinstance(value, str):
+                for token in tokenize(value):
+                    terms[token] += weight
+        return terms
+
+    @staticmethod
+    def _category(codes: Dict[str, int], value) -> int:
+        return codes.setdefault(str(value or "").lower(), len(codes))
+
+    def _add(self, key: str, row: int, city: str, client: Dict, client_fingerprint: int) -> None:
+        doc = len(self._rows)
+        if doc >= MAX_DOCS:
+            raise ValueError(f"The search index holds at most {MAX_DOCS} documents")
+        terms = self._terms(client)
+        length = sum(terms.values())
+        for term, frequency in terms.items():
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                self._term_ids[term] = len(self._postings)
+                self._postings.append(posting(doc, frequency))
+                continue
+            if term_id not in self._owned:
+                # a single posting, or an array shared with a fork: append to an array of our own
+                self._postings[term_id] = array("I", packed(self._postings[term_id]).tobytes())
+                self._owned.add(term_id)
+            self._postings[term_id].append(posting(doc, frequency))
+        self._rows.append(row)
+        self._fingerprints.append(client_fingerprint)
+        self._lengths.append(length)
+        self._alive.append(1)
+        self._city_codes.append(self._category(self._cities, city))
+        self._risk_codes.append(self._category(self._risks, client.get("risk_profile")))
+        self._ages.append(whole_number(client.get("age")))
+        self._last_contacted.append(whole_number(client.get("last_contacted_days")))
+        self._doc_ids[key] = doc
+        self._total_length += length
+
+    def _retire(self, doc: int) -> None:
+        self._alive[doc] = 0
+        self._total_length -= self._lengths[doc]
+
+    def _purge(self, retired: List[int]) -> None:
+        """Drop retired doc ids from every term's postings, in one pass over the index"""
+        retired = np.array(sorted(retired), dtype=np.uint32)
+        for term_id, postings in enumerate(self._postings):
+            postings = packed(postings)
+            if not len(postings):
+                continue
+            keep = ~np.isin(postings >> WEIGHT_BITS, retired)
+            if keep.all():
+                continue
+            self._postings[term_id] = array("I", postings[keep].tobytes())
+            self._owned.add(term_id)
+
+    def sync(self, repository: ClientRepository) -> Dict[str, int]:
+        """Bring the index in line with the repository's book: add new clients, re-index changed ones, drop the rest"""
+        counts = {"added": 0, "updated": 0, "removed": 0}
+        seen = set()
+        retired = []
+        with self._lock:
+            if len(self._rows) > 2 * len(self._doc_ids) + 1024:
+                # mostly retired doc ids by now: start over rather than keep scoring dead slots
+                self._reset()
+            for row, key, city, client in repository.records():
+                client_fingerprint = fingerprint(client)
+                doc = self._doc_ids.get(key)
+                if doc is not None:
+                    seen.add(key)
+                    self._rows[doc] = row  # row ids are the new repository's
+                    if self._fingerprints[doc] == client_fingerprint:
+                        continue
+                    self._retire(doc)
+                    retired.append(doc)
+                    counts["updated"] += 1
+                else:
+                    counts["added"] += 1
+                self._add(key, row, city, client, client_fingerprint)
+                seen.add(key)
+            for key in [key for key in self._doc_ids if key not in seen]:
+                doc = self._doc_ids.pop(key)
+                self._retire(doc)
+                retired.append(doc)
+                counts["removed"] += 1
+            if retired:
+                self._purge(retired)
+            self.repository = repository
+        return counts
+
+    def search(
+        self,
+        query: str,
+        risk_profile: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+        max_last_contacted_days: Optional[int] = None,
+        city: Optional[str] = None,
+        limit: int = 5,
+    ) -> List[Tuple[float, str, Dict]]:
+        """(score, city, client) for the top clients for query by BM25 score among those passing every given filter"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            count = len(self._doc_ids)
+            if not terms or not count:
+                return []
+            average_length = self._total_length / count or 1.0
+            lengths = np.frombuffer(self._lengths, dtype=np.float32)
+            scores = np.zeros(len(self._rows))
+            for term in terms:
+                term_id = self._term_ids.get(term)
+                if term_id is None:
+                    continue
+                postings = packed(self._postings[term_id])
+                if not len(postings):
+                    continue
+                ids = postings >> WEIGHT_BITS
+                frequency = (postings & WEIGHT_MASK) / 2.0
+                idf = math.log(1 + (count - len(ids) + 0.5) / (len(ids) + 0.5))
+                scores[ids] += idf * frequency * (self.k1 + 1) / (
+                    frequency + self.k1 * (1 - self.b + self.b * lengths[ids] / average_length)
+                )
+
+            passes = (scores > 0) & (np.frombuffer(self._alive, dtype=np.uint8) == 1)
+            for codes, column, value in (
+                (self._risks, self._risk_codes, risk_profile),
+                (self._cities, self._city_codes, city),
+            ):
+                if value is not None:
+                    code = codes.get(value.lower())
+                    passes &= False if code is None else np.frombuffer(column, dtype=np.uint32) == code
+            ages = np.frombuffer(self._ages, dtype=np.int32)
+            last_contacted = np.frombuffer(self._last_contacted, dtype=np.int32)
+            for column, bound, above in (
+                (ages, min_age, True), (ages, max_age, False), (last_contacted, max_last_contacted_days, False),
+            ):
+                if bound is not None:
+                    passes &= (column != MISSING) & ((column >= bound) if above else (column <= bound))
+
+            candidates = np.flatnonzero(passes)
+            top = candidates[np.argsort(-scores[candidates], kind="stable")[:limit]]
+            ranked = [(float(scores[doc]), self._rows[doc]) for doc in top]
+            repository = self.repository
+        records = repository.by_ids([row for _, row in ranked])
+        return [(score, *records[row]) for score, row in ranked if row in records]
+
+    def snippets(self, client: Dict, query: str, per_client: int = 2) -> List[Dict]:
+        """The sentences of the client's notes and details that match the query best"""
+        terms = set(tokenize(query))
+        ranked = []
+        for field in SNIPPET_FIELDS:
+            value = client.get(field)
+            for sentence in SENTENCE.findall(value if isinstance(value, str) else ""):
+                hits = len(terms.intersection(tokenize(sentence)))
+                if hits:
+                    text = sentence.strip()
+                    if len(text) > MAX_SNIPPET_CHARS:
+                        text = text[:MAX_SNIPPET_CHARS - 1].rstrip() + "…"
+                    ranked.append((hits, field, text))
+        ranked.sort(key=lambda item: -item[0])
+        return [{"field": field, "text": text} for _, field, text in ranked[:per_client]]
+
+    def search_json(self, query: str, limit: int = 5, **filters) -> str:
+        """Top-k matches as the JSON the search_clients tool returns: who matched, and the matching snippets only"""
+        results = []
+        for score, city, client in self.search(query, limit=limit, **filters):
+            results.append({
+                "name": client.get("name"),
+                "city": city,
+                "email": client.get("email"),
+                "age": client.get("age"),
+                "risk_profile": client.get("risk_profile"),
+                "last_contacted_days": client.get("last_contacted_days"),
+                "score": round(score, 3),
+                "snippets": self.snippets(client, query),
+            })
+        return json.dumps(results)
+
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from cache import TTLCache
+from observability import get_logger, log_event
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a characters-per-token estimate
+    tiktoken = None
+
+
+logger = get_logger("context_window")
+
+CHARS_PER_TOKEN = 4
+# Every message costs a few tokens of framing on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+if tiktoken is not None:
+    try:
+        _encoding = tiktoken.get_encoding("o200k_base")  # gpt-4o
+    except Exception:
+        _encoding = None
+
+
+# Token counts by digest of the text, so a cached count never keeps a large tool result alive
+_token_counts = TTLCache(max_entries=8192, ttl_seconds=3600)
+
+
+def count_text_tokens(text: str) -> int:
+    if _encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+    count = _token_counts.get(key)
+    if count is None:
+        count = len(_encoding.encode(text))
+        _token_counts.set(key, count)
+    return count
+
+
+def count_message_tokens(message: Dict) -> int:
+    content = message.get("content") or ""
+    if not isinstance(content, str):
+        content = json.dumps(content)
+    return MESSAGE_OVERHEAD_TOKENS + count_text_tokens(content)
+
+
+def compact_tool_message(message: Dict) -> Dict:
+    """Replace a bulky tool result with a short reference the model can act on"""
+    name = message.get("name", "tool")
+    content = message.get("content") or ""
+    try:
+        payload = json.loads(content)
+    except (TypeError, ValueError):
+        payload = None
+    if isinstance(payload, list):
+        shape = f"{len(payload)} records"
+    elif isinstance(payload, dict):
+        shape = f"{len(payload)} entries"
+    else:
+        shape = "text"
+    compacted = dict(message)
+    compacted["content"] = (
+        f"[Earlier {name} result compacted: {shape}, {len(content)} characters. "
+        f"Call {name} again if the details are needed.]"
+    )
+    return compacted
+
+
+# summarizer(newly dropped messages, summary of the ones dropped before them or None) -> the updated summary
+Summarizer = Callable[[List[Dict], Optional[str]], Awaitable[str]]
+
+
+def split_turns(messages: List[Dict]) -> List[List[Dict]]:
+    """Group messages into turns, each starting at a user message"""
+    turns = []
+    for message in messages:
+        if message.get("role") == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+class ContextWindow:
+    """Chooses what part of a conversation is sent upstream, keeping the prompt within a token budget.
+
+    The stored history is never modified. The view sent to the model always has the system prompt and the
+    current turn; tool results from earlier turns are compacted to a reference, and when that is not enough
+    the oldest turns are dropped, optionally rolled into a summary.
+
+    The summary is built incrementally: it is cached per run of dropped turns, and when more turns fall out of
+    the window the summarizer folds just those into the cached summary of the ones dropped before. A summarizer
+    that fails or takes longer than summary_timeout_seconds leaves the older summary, if any, and the dropped
+    turns are simply truncated.
+    """
+
+    def __init__(
+        self,
+        budget_tokens: int = 12000,
+        compact_threshold_tokens: int = 200,
+        summarizer: Optional[Summarizer] = None,
+        summary_timeout_seconds: float = 5.0,
+    ):
+        self.budget_tokens = budget_tokens
+        self.compact_threshold_tokens = compact_threshold_tokens
+        self.summarizer = summarizer
+        self.summary_timeout_seconds = summary_timeout_seconds
+        self._summaries = TTLCache(max_entries=256, ttl_seconds=3600)
+
+    async def fit(self, message_history: List[Dict]) -> List[Dict]:
+        if not message_history:
+            return message_history
+        system = [message_history[0]] if message_history[0].get("role") == "system" else []
+        turns = split_turns(message_history[len(system):])
+        if not turns:
+            return list(message_history)
+        current = turns.pop()
+
+        earlier = []
+        for turn in turns:
+            earlier.append([
+                compact_tool_message(message)
+                if message.get("role") in ("function", "tool")
+                and count_message_tokens(message) > self.compact_threshold_tokens
+                else message
+                for message in turn
+            ])
+
+        fixed_tokens = sum(count_message_tokens(message) for message in system + current)
+        turn_tokens = [sum(count_message_tokens(message) for message in turn) for turn in earlier]
+        dropped = []
+        while earlier and fixed_tokens + sum(turn_tokens) > self.budget_tokens:
+            dropped.append(earlier.pop(0))
+            turn_tokens.pop(0)
+
+        summary = []
+        if dropped and self.summarizer is not None:
+            text = await self._summary(dropped)
+            if text:
+                summary = [{"role": "system", "content": f"Summary of the earlier conversation: {text}"}]
+        return system + summary + [message for turn in earlier for message in turn] + current
+
+    async def _summary(self, dropped: List[List[Dict]]) -> Optional[str]:
+        """Summary of the dropped turns, extending the cached summary of the longest run of them already summarized"""
+        # one key per prefix of the dropped turns, chained so each covers every turn before it
+        keys = []
+        digest = hashlib.sha256()
+        for turn in dropped:
+            digest.update(json.dumps(turn, sort_keys=True, default=str).encode())
+            keys.append(digest.copy().hexdigest())
+
+        previous, summarized = None, 0
+        for position in range(len(dropped), 0, -1):
+            previous = self._summaries.get(keys[position - 1])
+            if previous is not None:
+                summarized = position
+                break
+        if summarized == len(dropped):
+            return previous
+
+        new_messages = [message for turn in dropped[summarized:] for message in turn]
+        try:
+            summary = await asyncio.wait_for(self.summarizer(new_messages, previous), self.summary_timeout_seconds)
+        except Exception as e:
+            # the turn goes ahead without the newest turns summarized; the next one tries again
+            log_event(logger, logging.WARNING, "context_summary_failed", error=type(e).__name__, turns=len(dropped) - summarized)
+            return previous
+        self._summaries.set(keys[-1], summary)
+        return summary
+
+
+def create_context_window(summarizer=None) -> ContextWindow:
+    return ContextWindow(
+        budget_tokens=int(os.getenv("CONTEXT_TOKEN_BUDGET", "12000")),
+        compact_threshold_tokens=int(os.getenv("CONTEXT_COMPACT_THRESHOLD_TOKENS", "200")),
+        summarizer=summarizer if os.getenv("CONTEXT_SUMMARY_ENABLED", "false").lower() == "true" else None,
+        summary_timeout_seconds=float(os.getenv("CONTEXT_SUMMARY_TIMEOUT_SECONDS", "5")),
+    )
@@ -0,0 +1,230 @@
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from client_repository import CLIENTS_PATH, ClientRepository
+from client_search import ClientSearchIndex
+from fund_screener import FUNDS_PATH, FundTable
+from observability import Counter, get_logger, log_event, registry, span
+
+
+logger = get_logger("datasets")
+
+DATASET_WATCH_ENABLED = os.getenv("DATASET_WATCH_ENABLED", "true").lower() == "true"
+DATASET_POLL_SECONDS = float(os.getenv("DATASET_POLL_SECONDS", "5"))
+
+dataset_reloads = registry.register(Counter(
+    "advisor_dataset_reloads_total", "Dataset reloads, by whether the new snapshot was swapped in", ("outcome",),
+))
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """One consistent version of the client book, its search index and the fund universe.
+
+    Nothing in a snapshot is changed after it is published; a reload builds a new one. A chat turn pins the
+    current snapshot when it starts (DatasetStore.pin) and every tool call in it reads that one, so the turn
+    sees one version even if a reload lands meanwhile.
+    """
+    version: int
+    clients: ClientRepository
+    search: ClientSearchIndex
+    funds: FundTable
+    sources: Dict[str, Optional[Tuple[int, int]]]
+    loaded_at: float = field(default_factory=time.time)
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+
+# The snapshot pinned by the chat turn running in this task; tool threads run in a copy of the task's context
+_pinned: ContextVar[Optional[Snapshot]] = ContextVar("dataset_snapshot", default=None)
+
+
+class DatasetStore:
+    """Holds the current Snapshot and replaces it when the data files change.
+
+    reload() builds the next snapshot in the calling thread, warms its query and serialization caches, then
+    publishes it with a single reference assignment; readers never take a lock. watch() polls the files'
+    modification times from a background thread and reloads once a change has settled.
+    """
+
+    def __init__(self, snapshot: Snapshot, clients_path: str = CLIENTS_PATH, funds_path: str = FUNDS_PATH):
+        self.clients_path = clients_path
+        self.funds_path = funds_path
+        self._current = snapshot
+        self._reload_lock = threading.Lock()  # one reload at a time; readers never wait on it
+        self._listeners: List[Callable[[Snapshot], None]] = []
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._failed_sources = None  # file signatures of the last failed reload, not retried until they change
+
+    @classmethod
+    def open(cls, clients_path: str = CLIENTS_PATH, funds_path: str = FUNDS_PATH) -> "DatasetStore":
+        """A store serving the files as they are now as its first snapshot.
+
+        The snapshot is the only reference to the data: nothing else holds on to it, so once a reload swaps it
+        out and the turns pinned to it finish, it is freed.
+        """
+        sources = {"clients": file_signature(clients_path), "funds": file_signature(funds_path)}
+        clients = ClientRepository.from_json_file(clients_path)
+        snapshot = Snapshot(
+            1, clients, ClientSearchIndex.from_repository(clients), FundTable.from_json_file(funds_path), sources,
+        )
+        return cls(snapshot, clients_path, funds_path)
+
+    def snapshot(self) -> Snapshot:
+        """The snapshot pinned by the current chat turn, or the latest one outside a turn"""
+        return _pinned.get() or self._current
+
+    def pin(self) -> Snapshot:
+        """Pin the latest snapshot for the rest of the current task (one chat turn) and return it"""
+        snapshot = self._current
+        _pinned.set(snapshot)
+        return snapshot
+
+    def on_swap(self, listener: Callable[[Snapshot], None]) -> None:
+        """Call listener(snapshot) after each new snapshot is published, e.g. to drop results cached from the old one"""
+        self._listeners.append(listener)
+
+    def _sources(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        return {"clients": file_signature(self.clients_path), "funds": file_signature(self.funds_path)}
+
+    def build(self, previous: Snapshot) -> Snapshot:
+        """The next snapshot, built from the files without touching the one being served"""
+        timings = {}
+        sources = self._sources()
+
+        def timed(name, build):
+            started = time.perf_counter()
+            with span("dataset_load", name):
+                result = build()
+            timings[name] = round((time.perf_counter() - started) * 1000, 1)
+            return result
+
+        clients = previous.clients
+        search = previous.search
+        if sources["clients"] != previous.sources.get("clients"):
+            clients = timed("clients", lambda: ClientRepository.from_json_file(self.clients_path))
+            # re-indexes only the clients whose record changed, on a copy so the served index stays as it is
+            search = timed("search_index", lambda: self._synced(previous.search, clients))
+        funds = previous.funds
+        if sources["funds"] != previous.sources.get("funds"):
+            funds = timed("funds", lambda: FundTable.from_json_file(self.funds_path))
+        timed("warm", lambda: self._warm(clients, funds, previous.clients))
+        return Snapshot(previous.version + 1, clients, search, funds, sources, timings_ms=timings)
+
+    @staticmethod
+    def _synced(index: ClientSearchIndex, clients: ClientRepository) -> ClientSearchIndex:
+        index = index.fork()
+        index.sync(clients)
+        return index
+
+    @staticmethod
+    def _warm(clients: ClientRepository, funds: FundTable, previous: Optional[ClientRepository] = None) -> None:
+        """Fill the caches the first requests after a swap would otherwise pay for.
+
+        A new book replays the queries hot in the previous one, within the new book's cache budget; an unchanged
+        book keeps its own caches.
+        """
+        if clients is not previous:
+            clients.warm(previous.hot_queries() if previous is not None else None)
+        funds.screen_json()
+
+    def reload(self, force: bool = False) -> bool:
+        """Build and publish a new snapshot if the files changed; False when nothing was swapped.
+
+        force retries files whose last reload failed instead of waiting for them to change again. Files that
+        match the current snapshot are never reloaded, so a forced reload of unchanged data keeps the version,
+        the caches and the paging cursors issued against it.
+        """
+        with self._reload_lock:
+            previous = self._current
+            sources = self._sources()
+            if sources == previous.sources or (not force and sources == self._failed_sources):
+                return False
+            started = time.perf_counter()
+            try:
+                snapshot = self.build(previous)
+            except Exception as e:
+                # a file caught half-written or malformed (bad JSON, a record that is not an object, a value SQLite
+                # cannot store...): keep serving the current snapshot and retry on the next change
+                self.failures += 1
+                self._failed_sources = sources
+                self.last_error = f"{type(e).__name__}: {e}"
+                dataset_reloads.inc(outcome="error")
+                log_event(logger, logging.ERROR, "dataset_reload_failed", version=previous.version, error=self.last_error)
+                return False
+            snapshot.timings_ms["total"] = round((time.perf_counter() - started) * 1000, 1)
+            self._current = snapshot
+            self.reloads += 1
+            self.last_error = None
+        dataset_reloads.inc(outcome="swapped")
+        log_event(logger, logging.INFO, "dataset_reloaded", version=snapshot.version, **snapshot.timings_ms)
+        for listener in self._listeners:
+            listener(snapshot)
+        return True
+
+    def _watch(self, poll_seconds: float) -> None:
+        pending = None
+        while not self._stop.wait(poll_seconds):
+            try:
+                sources = self._sources()
+                if sources == self._current.sources:
+                    pending = None
+                elif sources == pending:
+                    # unchanged since the last poll, so the writer is done with the files
+                    self.reload()
+                    pending = None
+                else:
+                    pending = sources
+            except Exception:
+                # nothing one reload does may end the thread; the next poll tries again
+                logger.exception("Dataset watcher poll failed")
+
+    def watch(self, poll_seconds: float = DATASET_POLL_SECONDS) -> None:
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(poll_seconds,), name="dataset-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def status(self) -> Dict:
+        snapshot = self._current
+        return {
+            "version": snapshot.version,
+            "loaded_at": snapshot.loaded_at,
+            "timings_ms": snapshot.timings_ms,
+            "clients": len(snapshot.search),
+            "funds": snapshot.funds.size,
+            "sources": {
+                name: {"path": path, "mtime_ns": signature[0], "bytes": signature[1]} if signature else {"path": path}
+                for (name, signature), path in zip(snapshot.sources.items(), (self.clients_path, self.funds_path))
+            },
+            "watching": self._watcher is not None and self._watcher.is_alive(),
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+datasets = DatasetStore.open()
@@ -0,0 +1,160 @@
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+FUNDS_PATH = os.getenv("FUNDS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "funds.json"))
+
+# Returned when nothing passes the screen, so the model always has something to suggest
+FALLBACK_TICKER = "EMBFX"
+
+# Fields of a fund record, in the order the data file lists them
+FUND_FIELDS = (
+    "name", "ticker", "category", "morningstar_rating", "risk_level", "total_return_ytd", "expense_ratio",
+    "minimum_investment",
+)
+
+# sort_by value -> (column, highest first)
+SORT_KEYS = {
+    "total_return_ytd": ("total_return_ytd", True),
+    "expense_ratio": ("expense_ratio", False),
+}
+
+
+class FundTable:
+    """Fund universe held as NumPy columns, loaded once and screened with a single boolean mask.
+
+    Records are serialized once at load time and only those strings are kept, not the parsed dicts; a screen
+    joins the strings of the funds that pass. A request for only some fields gets its own set of strings,
+    serialized the first time that field set is asked for and reused after.
+    """
+
+    def __init__(self, funds: List[Dict]):
+        self.size = len(funds)
+        self.records = [json.dumps(fund) for fund in funds]
+        self._projections: Dict[frozenset, List[str]] = {}
+        self.risk_levels = sorted({fund["risk_level"] for fund in funds})
+        risk_codes = {risk_level: code for code, risk_level in enumerate(self.risk_levels)}
+        self.risk_level = np.array([risk_codes[fund["risk_level"]] for fund in funds], dtype=np.int8)
+        self.morningstar_rating = np.array([fund["morningstar_rating"] for fund in funds], dtype=np.int8)
+        self.expense_ratio = np.array([fund["expense_ratio"] for fund in funds], dtype=np.float64)
+        self.minimum_investment = np.array([fund["minimum_investment"] for fund in funds], dtype=np.float64)
+        self.total_return_ytd = np.array([fund["total_return_ytd"] for fund in funds], dtype=np.float64)
+        self.fallback_index = next(
+            (position for position, fund in enumerate(funds) if fund["ticker"] == FALLBACK_TICKER), None
+        )
+
+    @classmethod
+    def from_json_file(cls, path: str = FUNDS_PATH) -> "FundTable":
+        with open(path) as f:
+            return cls(json.load(f))  # the parsed list is dropped once the columns are built
+
+    def screen_indices(
+        self,
+        risk_level: Optional[str] = None,
+        min_rating: Optional[int] = None,
+        max_expense_ratio: Optional[float] = None,
+        estimated_available_funds: Optional[float] = None,
+        sort_by: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> np.ndarray:
+        """Positions of the funds passing every given criterion, in table order unless sort_by is given"""
+        mask = np.ones(self.size, dtype=bool)
+        if risk_level is not None:
+            if risk_level not in self.risk_levels:
+                return np.empty(0, dtype=np.intp)
+            mask &= self.risk_level == self.risk_levels.index(risk_level)
+        if min_rating is not None:
+            mask &= self.morningstar_rating >= min_rating
+        if max_expense_ratio is not None:
+            mask &= self.expense_ratio <= max_expense_ratio
+        if estimated_available_funds is not None:
+            mask &= self.minimum_investment <= estimated_available_funds
+
+        return self._rank(np.flatnonzero(mask), sort_by, limit)
+
+    def _rank(self, indices: np.ndarray, sort_by: Optional[str], limit: Optional[int]) -> np.ndarray:
+        if sort_by in SORT_KEYS:
+            column, descending = SORT_KEYS[sort_by]
+            values = getattr(self, column)[indices]
+            # stable sort so ties keep table order
+            order = np.argsort(-values if descending else values, kind="stable")
+            indices = indices[order]
+        if limit is not None and limit > 0:
+            indices = indices[:limit]
+        return indices
+
+    def records_for(self, fields: Optional[frozenset] = None) -> List[str]:
+        """Every fund serialized with only the given fields (all of them by default), in table order"""
+        if fields is None:
+            return self.records
+        records = self._projections.get(fields)
+        if records is None:
+            records = [
+                json.dumps({key: value for key, value in json.loads(record).items() if key in fields})
+                for record in self.records
+            ]
+            self._projections[fields] = records
+        return records
+
+    def _to_json(self, indices: np.ndarray, fields: Optional[frozenset] = None) -> str:
+        records = self.records_for(fields)
+        if len(indices) == 0:
+            return records[self.fallback_index] if self.fallback_index is not None else "[]"
+        return "[" + ", ".join(records[i] for i in indices) + "]"
+
+    def screen_many_json(
+        self,
+        profiles: List[Dict],
+        sort_by: Optional[str] = None,
+        limit: Optional[int] = None,
+        fields: Optional[frozenset] = None,
+    ) -> str:
+        """Screen several client profiles in one pass, as a JSON object of {label: funds}.
+
+        Each profile carries a label plus the get_funds criteria; all profiles are masked against the table
+        together as one (profiles x funds) array. A profile with no match gets the fallback fund, as in screen_json.
+        A label given more than once is suffixed " (2)", " (3)", ... in profile order, so every key is distinct.
+        """
+        def column(name, missing, dtype):
+            return np.array([missing if p.get(name) is None else p[name] for p in profiles], dtype=dtype)[:, None]
+
+        risk_codes = {risk_level: code for code, risk_level in enumerate(self.risk_levels)}
+        wanted_risk = np.array(
+            [risk_codes.get(p.get("risk_level"), -1) if p.get("risk_level") is not None else -2 for p in profiles],
+            dtype=np.int8,
+        )[:, None]
+        mask = (wanted_risk == -2) | (self.risk_level[None, :] == wanted_risk)
+        mask &= self.morningstar_rating[None, :] >= column("min_rating", 0, np.int8)
+        mask &= self.expense_ratio[None, :] <= column("max_expense_ratio", np.inf, np.float64)
+        mask &= self.minimum_investment[None, :] <= column("estimated_available_funds", np.inf, np.float64)
+
+        results = []
+        labels = set()
+        for position, profile in enumerate(profiles):
+            indices = self._rank(np.flatnonzero(mask[position]), sort_by, limit)
+            label = base = str(profile.get("label") or f"profile_{position + 1}")
+            repeat = 1
+            while label in labels:
+                # two clients with the same name must not collapse into one key of the object
+                repeat += 1
+                label = f"{base} ({repeat})"
+            labels.add(label)
+            results.append(f"{json.dumps(label)}: {self._to_json(indices, fields)}")
+        return "{" + ", ".join(results) + "}"
+
+    def screen_json(self, fields: Optional[frozenset] = None, **criteria) -> str:
+        """Matching funds as a JSON array, or the fallback fund on its own when nothing matches"""
+        return self._to_json(self.screen_indices(**criteria), fields)
+
+    def screen_records(self, fields: Optional[frozenset] = None, **criteria) -> List[str]:
+        """Matching funds as serialized records to page through; see fallback_json for when there are none"""
+        records = self.records_for(fields)
+        return [records[i] for i in self.screen_indices(**criteria)]
+
+    def fallback_json(self, fields: Optional[frozenset] = None) -> Optional[str]:
+        """The fund offered when nothing passes a screen, serialized with the given fields, or None without one"""
+        return self.records_for(fields)[self.fallback_index] if self.fallback_index is not None else None
+
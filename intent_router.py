@@ -0,0 +1,300 @@
+import difflib
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from client_repository import ClientRepository
+from observability import Counter, Histogram, registry
+
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "false").lower() == "true"
+# Below this the message goes to the model; 1.0 means every slot matched the book exactly
+INTENT_ROUTER_MIN_CONFIDENCE = float(os.getenv("INTENT_ROUTER_MIN_CONFIDENCE", "0.85"))
+
+intent_routes = registry.register(Counter(
+    "advisor_intent_routes_total", "Chat messages seen by the intent router, by intent and outcome (routed, or why it fell back to the model)", ("intent", "outcome"),
+))
+intent_confidence = registry.register(Histogram(
+    "advisor_intent_confidence", "Confidence of the intent router's matches", ("intent",),
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 1.0),
+))
+
+# Rule 7b of the advisor prompt: (min_rating, max_expense_ratio) per risk level
+FUND_CRITERIA = {"High": (2, 0.002)}
+DEFAULT_FUND_CRITERIA = (3, 0.001)
+RISK_LEVELS = {"low": "Low", "moderate": "Moderate", "medium": "Moderate", "high": "High"}
+# What a city overview shows (rule 4a), so only these fields are fetched
+OVERVIEW_FIELDS = ["name", "email", "age", "profession", "last_contacted_days"]
+
+FILLER = re.compile(
+    r"^(?:(?:hi|hey|hello|ok|okay)\b[,!]?\s*)?(?:(?:please|can you|could you|would you|will you)\s+)?"
+    r"|\s*(?:,?\s*(?:please|thanks|thank you))?[\s?.!]*$"
+)
+VERB = r"(?:(?:list|show|get|give|find|recommend|suggest|pull up|what are|who are|which are)(?: me)?(?: all)?(?: of)?(?: some)?(?: the)? )?"
+CLIENTS_IN_CITY = re.compile(
+    VERB + r"(?:my |our |the )?clients? (?:in|at|from|based in|located in) (?P<city>[a-z][a-z .'-]*)$"
+)
+FUNDS = r"(?:good |suitable )?(?:funds?|fund recommendations|fund ideas|recommended funds)"
+FUNDS_FOR_PROFILE = re.compile(
+    VERB + FUNDS + r" for (?:a |an )?(?P<risk>low|moderate|medium|high)[- ]risk (?:client|investor)"
+    r" (?:with|who has|that has) (?P<amount>\$?\s?\d[\d,]*(?:\.\d+)?\s?(?:k|m|thousand|million)?)"
+    r"(?: (?:to invest|available|available to invest|in cash|of investable (?:assets|funds)))?$"
+)
+FUNDS_FOR_CLIENT = re.compile(VERB + FUNDS + r" for (?P<name>[a-z][a-z .'-]*)$")
+AMOUNT_SCALES = {"k": 1_000, "thousand": 1_000, "m": 1_000_000, "million": 1_000_000}
+
+
+def normalize(message: str) -> str:
+    """Lowercased message with greetings, politeness and trailing punctuation stripped"""
+    text = re.sub(r"\s+", " ", (message or "").strip().lower()).replace("’", "'")
+    return FILLER.sub("", text).strip()
+
+
+def parse_amount(text: str) -> Optional[float]:
+    match = re.fullmatch(r"\$?\s?(\d[\d,]*(?:\.\d+)?)\s?(k|m|thousand|million)?", text.strip())
+    if match is None:
+        return None
+    return float(match.group(1).replace(",", "")) * AMOUNT_SCALES.get(match.group(2), 1)
+
+
+def money(amount) -> str:
+    return f"${amount:,.0f}"
+
+
+@dataclass(frozen=True)
+class Route:
+    """A message the router can answer itself: the tool call to make and how to phrase its result"""
+    intent: str
+    tool: str
+    arguments: dict
+    confidence: float
+    render: Callable[[str], Optional[str]]  # tool result -> reply, or None to hand the turn to the model
+
+
+def more_pages(page: dict, shown: int, what: str) -> List[str]:
+    """A closing note when the tool result was only the first page"""
+    if not page.get("next_cursor"):
+        return []
+    return ["", f"These are the first {shown} of {page.get('total')} {what}; ask for the rest to see more."]
+
+
+def render_clients(city: str) -> Callable[[str], Optional[str]]:
+    def render(result: str) -> Optional[str]:
+        page = json.loads(result)
+        if not isinstance(page, dict) or not isinstance(page.get("clients"), list):
+            return None
+        clients = page["clients"]
+        if not clients:
+            return f"You have no clients in {city}."
+        lines = [f"Here are your clients in {city}:", ""]
+        for client in clients:
+            details = [client.get("email") or "no email on file"]
+            if client.get("age") is not None:
+                details.append(f"age {client['age']}")
+            if client.get("profession"):
+                details.append(client["profession"])
+            if client.get("last_contacted_days") is not None:
+                details.append(f"last contacted {client['last_contacted_days']} days ago")
+            lines.append(f"- **{client.get('name')}**: {', '.join(details)}")
+        lines += more_pages(page, len(clients), "clients")
+        return "\n".join(lines)
+
+    return render
+
+
+def unmet_criteria(fund: dict, arguments: dict) -> List[str]:
+    """The screening criteria a fund fails, phrased for the reply; empty when it meets them all"""
+    unmet = []
+    if fund.get("risk_level") != arguments["risk_level"]:
+        unmet.append(f"it is {str(fund.get('risk_level')).lower()} risk, not {arguments['risk_level'].lower()}")
+    if (fund.get("morningstar_rating") or 0) < arguments["min_rating"]:
+        unmet.append(f"it is rated {fund.get('morningstar_rating')} stars, below {arguments['min_rating']}")
+    if (fund.get("expense_ratio") or 0) > arguments["max_expense_ratio"]:
+        unmet.append(
+            f"its {fund.get('expense_ratio', 0) * 100:.2f}% expense ratio is above {arguments['max_expense_ratio'] * 100:.2f}%"
+        )
+    if (fund.get("minimum_investment") or 0) > arguments["estimated_available_funds"]:
+        unmet.append(
+            f"its {money(fund.get('minimum_investment', 0))} minimum is more than the "
+            f"{money(arguments['estimated_available_funds'])} available"
+        )
+    return unmet
+
+
+def fund_line(fund: dict) -> str:
+    return (
+        f"- **{fund.get('name')} ({fund.get('ticker')})**: {fund.get('category')}, {str(fund.get('risk_level')).lower()} risk, "
+        f"{fund.get('morningstar_rating')}-star Morningstar rating, {fund.get('total_return_ytd')}% return YTD, "
+        f"{fund.get('expense_ratio', 0) * 100:.2f}% expense ratio, {money(fund.get('minimum_investment', 0))} minimum"
+    )
+
+
+def render_funds(for_whom: str, arguments: dict) -> Callable[[str], Optional[str]]:
+    criteria = (
+        f"{arguments['risk_level'].lower()}-risk funds rated at least {arguments['min_rating']} stars, with an "
+        f"expense ratio of at most {arguments['max_expense_ratio'] * 100:.2f}% and a minimum investment within "
+        f"the {money(arguments['estimated_available_funds'])} available"
+    )
+
+    def render(result: str) -> Optional[str]:
+        page = json.loads(result)
+        if not isinstance(page, dict) or not isinstance(page.get("funds"), list):
+            return None
+        funds = page["funds"]
+        fallback = page.get("closest_match")
+        if not funds and isinstance(fallback, dict):
+            # nothing passed the screen and the tool offered its fallback fund instead: say so, and say why it
+            # falls short rather than describe it with criteria it does not meet
+            unmet = unmet_criteria(fallback, arguments)
+            if not unmet:
+                return None
+            return "\n".join([
+                f"No fund in the universe fits {for_whom}: none of them are {criteria}.",
+                "",
+                "The closest option the screen falls back to is:",
+                "",
+                fund_line(fallback),
+                "",
+                f"It does not meet the criteria: {'; '.join(unmet)}.",
+            ])
+        if not funds or any(unmet_criteria(fund, arguments) for fund in funds):
+            # the template vouches for every listed fund, so anything it cannot vouch for goes to the model
+            return None
+        lines = [f"Here are the funds that fit {for_whom}:", ""]
+        lines += [fund_line(fund) for fund in funds]
+        lines += ["", f"These are {criteria}."]
+        lines += more_pages(page, len(funds), "matching funds")
+        return "\n".join(lines)
+
+    return render
+
+
+def fund_arguments(risk_level: str, amount: float) -> dict:
+    min_rating, max_expense_ratio = FUND_CRITERIA.get(risk_level, DEFAULT_FUND_CRITERIA)
+    return {
+        "risk_level": risk_level,
+        "min_rating": min_rating,
+        "max_expense_ratio": max_expense_ratio,
+        "estimated_available_funds": amount,
+    }
+
+
+class IntentRouter:
+    """Answers the most common plain lookups without the model.
+
+    A small grammar recognises "clients in <city>" and "funds for <a risk profile with an amount | a client>".
+    Slots are matched against the book (a misspelt city matches its closest one with a lower confidence), and
+    only a whole-message match with every slot filled at or above min_confidence is routed; anything else,
+    or a tool result the templates cannot phrase, goes to the model as before.
+    """
+
+    def __init__(self, clients: Callable[[], ClientRepository], min_confidence: float = INTENT_ROUTER_MIN_CONFIDENCE):
+        self.clients = clients  # the current client book, read afresh for every message
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self._outcomes: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def _record(self, intent: str, outcome: str) -> None:
+        intent_routes.inc(intent=intent, outcome=outcome)
+        with self._lock:
+            self._outcomes[intent][outcome] += 1
+
+    def _closest_city(self, city: str) -> Tuple[Optional[str], float]:
+        cities = self.clients().cities()
+        for known in cities:
+            if known.lower() == city:
+                return known, 1.0
+        best = difflib.get_close_matches(city, [known.lower() for known in cities], n=1, cutoff=0.0)
+        if not best:
+            return None, 0.0
+        known = next(known for known in cities if known.lower() == best[0])
+        return known, difflib.SequenceMatcher(None, city, best[0]).ratio()
+
+    def classify(self, message: str) -> Tuple[str, Optional[Route], str]:
+        """(intent, route or None, outcome) for one chat message"""
+        text = normalize(message)
+
+        match = CLIENTS_IN_CITY.fullmatch(text)
+        if match:
+            city, confidence = self._closest_city(match.group("city").strip())
+            if city is None:
+                return "clients_in_city", None, "unknown_slot"
+            arguments = {"city": city, "fields": OVERVIEW_FIELDS}
+            return "clients_in_city", Route("clients_in_city", "get_clients", arguments, confidence, render_clients(city)), "matched"
+
+        match = FUNDS_FOR_PROFILE.fullmatch(text)
+        if match:
+            risk_level = RISK_LEVELS[match.group("risk")]
+            amount = parse_amount(match.group("amount"))
+            if amount is None:
+                return "funds_for_profile", None, "unknown_slot"
+            arguments = fund_arguments(risk_level, amount)
+            for_whom = f"a {risk_level.lower()}-risk client with {money(amount)} to invest"
+            return "funds_for_profile", Route("funds_for_profile", "get_funds", arguments, 1.0, render_funds(for_whom, arguments)), "matched"
+
+        match = FUNDS_FOR_CLIENT.fullmatch(text)
+        if match:
+            found = self.clients().by_name(match.group("name").strip())
+            if len(found) != 1:
+                return "funds_for_client", None, "unknown_slot" if not found else "ambiguous"
+            _, client = found[0]
+            risk_level = RISK_LEVELS.get(str(client.get("risk_profile", "")).lower())
+            amount = client.get("estimated_available_funds")
+            if risk_level is None or not isinstance(amount, (int, float)):
+                return "funds_for_client", None, "unknown_slot"
+            arguments = fund_arguments(risk_level, amount)
+            for_whom = f"{client.get('name')} ({risk_level.lower()} risk, {money(amount)} available)"
+            return "funds_for_client", Route("funds_for_client", "get_funds", arguments, 1.0, render_funds(for_whom, arguments)), "matched"
+
+        return "none", None, "no_match"
+
+    def route(self, message: str) -> Optional[Route]:
+        """The route for a message the router is confident about, or None (already counted) to leave it to the model"""
+        intent, route, outcome = self.classify(message)
+        if route is not None:
+            intent_confidence.observe(route.confidence, intent=intent)
+            if route.confidence >= self.min_confidence:
+                return route
+            outcome = "low_confidence"
+        self._record(intent, outcome)
+        return None
+
+    async def answer(self, message: str, call_tool: Callable[[str, dict], Awaitable[str]]) -> Optional[Tuple[Route, str, str]]:
+        """(route, tool result, reply) when the router answers the message itself, None when the model should"""
+        route = self.route(message)
+        if route is None:
+            return None
+        result = await call_tool(route.tool, route.arguments)
+        try:
+            reply = route.render(result) if result else None
+        except (ValueError, TypeError, KeyError):
+            reply = None
+        if reply is None:
+            self._record(route.intent, "unrendered")
+            return None
+        self._record(route.intent, "routed")
+        return route, result, reply
+
+    def stats(self) -> Dict[str, dict]:
+        """Per intent: how often each outcome happened, and the share answered without the model"""
+        with self._lock:
+            outcomes = {intent: dict(counts) for intent, counts in self._outcomes.items()}
+        total = sum(sum(counts.values()) for counts in outcomes.values())
+        routed = sum(counts.get("routed", 0) for counts in outcomes.values())
+        return {
+            "enabled": INTENT_ROUTER_ENABLED,
+            "min_confidence": self.min_confidence,
+            "messages": total,
+            "route_rate": round(routed / total, 4) if total else 0.0,
+            "intents": {
+                intent: {
+                    **counts,
+                    "route_rate": round(counts.get("routed", 0) / sum(counts.values()), 4) if sum(counts.values()) else 0.0,
+                }
+                for intent, counts in outcomes.items()
+            },
+        }
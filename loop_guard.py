@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from observability import Counter as MetricCounter, registry
+
+
+turn_forced_final = registry.register(MetricCounter(
+    "advisor_turn_forced_final_total", "Chat turns forced to a final answer, by the budget that ran out", ("reason",),
+))
+tool_memo_hits = registry.register(MetricCounter(
+    "advisor_tool_memo_hits_total", "Repeated identical tool calls answered from the per-turn memo", ("name",),
+))
+
+
+# Tools reading state that changes within a turn (a queued email's delivery status): every call runs
+UNMEMOIZED_TOOLS = frozenset({"get_email_status"})
+
+
+def call_signature(tool_call) -> tuple:
+    """Identity of a tool call: its name plus its arguments with key order normalized"""
+    arguments = tool_call.function.arguments or ""
+    try:
+        arguments = json.dumps(json.loads(arguments), sort_keys=True)
+    except ValueError:
+        pass
+    return (tool_call.function.name, arguments)
+
+
+class TurnGuard:
+    """Bounds the work one chat turn can cause in the MAX_ITER tool loop.
+
+    Identical tool calls within the turn are answered from a memo instead of re-running the tool (so a repeated
+    send_email_gmail call cannot send twice), except for UNMEMOIZED_TOOLS. Once the turn has used its wall-clock or token budget, reached its
+    last iteration, or the model keeps repeating the same call, the next completion is requested with
+    tool_choice="none" so the model has to answer with what it already has.
+    """
+
+    def __init__(self, max_iterations: int, max_seconds: float, max_tokens: int, max_repeats: int = 2):
+        self.max_iterations = max_iterations
+        self.max_tokens = max_tokens
+        self.max_repeats = max_repeats
+        self.deadline = time.monotonic() + max_seconds
+        self.iterations = 0
+        self.tokens = 0
+        self.memo: Dict[tuple, asyncio.Future] = {}  # signature -> the call's task, finished or in flight
+        self.calls = Counter()
+        self.memo_hits = 0
+        self.forced = False
+
+    @classmethod
+    def from_env(cls, max_iterations: int) -> "TurnGuard":
+        return cls(
+            max_iterations=max_iterations,
+            max_seconds=float(os.getenv("TURN_MAX_SECONDS", "90")),
+            max_tokens=int(os.getenv("TURN_MAX_TOKENS", "100000")),
+            max_repeats=int(os.getenv("TURN_MAX_REPEATED_CALLS", "2")),
+        )
+
+    def record_usage(self, usage) -> None:
+        if usage is not None:
+            self.tokens += getattr(usage, "total_tokens", 0) or 0
+
+    def next_iteration(self) -> None:
+        self.iterations += 1
+
+    @property
+    def stop_reason(self) -> Optional[str]:
+        if self.iterations >= self.max_iterations - 1:
+            return "iterations"
+        if time.monotonic() >= self.deadline:
+            return "time"
+        if self.tokens >= self.max_tokens:
+            return "tokens"
+        if self.calls and max(self.calls.values()) > self.max_repeats:
+            return "repeated_tool_calls"
+        return None
+
+    def tool_choice(self) -> str:
+        """tool_choice for the next completion: "none" once the turn is out of budget"""
+        reason = self.stop_reason
+        if reason is None:
+            return "auto"
+        self.forced = True
+        turn_forced_final.inc(reason=reason)
+        return "none"
+
+    def memoize(self, call_tool):
+        """Wrap call_tool so identical calls within this turn run once.
+
+        The call's task is stored before it is awaited, so duplicates issued together (one gather over a
+        completion's tool calls) wait on the same run rather than each starting their own. A call that raised
+        is forgotten, so a later identical call runs again. UNMEMOIZED_TOOLS always run, though they still count
+        towards the repeated-call limit.
+        """
+        async def memoized_call_tool(tool_call):
+            signature = call_signature(tool_call)
+            self.calls[signature] += 1
+            if tool_call.function.name in UNMEMOIZED_TOOLS:
+                return await call_tool(tool_call)
+            task = self.memo.get(signature)
+            if task is not None:
+                self.memo_hits += 1
+                tool_memo_hits.inc(name=tool_call.function.name)
+            else:
+                task = self.memo[signature] = asyncio.ensure_future(call_tool(tool_call))
+            try:
+                return await task
+            except Exception:
+                if self.memo.get(signature) is task:
+                    del self.memo[signature]
+                raise
+
+        return memoized_call_tool
@@ -0,0 +1,229 @@
+import asyncio
+import itertools
+import os
+import smtplib
+import ssl
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict, Optional
+
+from observability import get_logger, span
+from session_store import InMemorySessionStore, SessionStore
+
+
+logger = get_logger("mailer")
+
+GMAIL_SMTP_HOST = "smtp.gmail.com"
+
+# Built once: creating a default context loads the system CA bundle, which is not free
+ssl_context = ssl.create_default_context()
+
+
+@dataclass
+class SMTPSettings:
+    host: str = GMAIL_SMTP_HOST
+    port: int = 465  # For SSL
+    use_ssl: bool = True
+    user: Optional[str] = None
+    password: Optional[str] = None  # For Gmail this is the App Password
+    timeout: float = 30
+
+    @classmethod
+    def from_env(cls) -> "SMTPSettings":
+        """Gmail over SSL by default; SMTP_HOST/SMTP_PORT/SMTP_USE_SSL point it at a local stand-in such as aiosmtpd"""
+        return cls(
+            host=os.getenv("SMTP_HOST", GMAIL_SMTP_HOST),
+            port=int(os.getenv("SMTP_PORT", "465")),
+            use_ssl=os.getenv("SMTP_USE_SSL", "true").lower() != "false",
+            user=os.getenv("GMAIL_USER"),
+            password=os.getenv("GMAIL_PASSWORD"),
+            timeout=float(os.getenv("SMTP_TIMEOUT_SECONDS", "30")),
+        )
+
+    def credentials_missing(self) -> bool:
+        return not self.user or (self.host == GMAIL_SMTP_HOST and not self.password)
+
+
+class SMTPConnectionPool:
+    """A few authenticated SMTP connections, reused across messages instead of a TLS + AUTH handshake per email.
+
+    Connections idle for longer than keepalive_seconds are probed with NOOP before reuse, and a connection the
+    server dropped is replaced transparently.
+    """
+
+    def __init__(self, settings: SMTPSettings, size: int = 2, keepalive_seconds: float = 60):
+        self.settings = settings
+        self.keepalive_seconds = keepalive_seconds
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []  # (server, last_used)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        settings = self.settings
+        if settings.use_ssl:
+            server = smtplib.SMTP_SSL(settings.host, settings.port, context=ssl_context, timeout=settings.timeout)
+        else:
+            server = smtplib.SMTP(settings.host, settings.port, timeout=settings.timeout)
+        if settings.user and settings.password:
+            try:
+                server.login(settings.user, settings.password)
+            except Exception:
+                self._discard(server)
+                raise
+        return server
+
+    def _checkout(self):
+        with self._lock:
+            idle = self._idle.pop() if self._idle else None
+        if idle is None:
+            return self._connect()
+        server, last_used = idle
+        if time.monotonic() - last_used > self.keepalive_seconds:
+            try:
+                alive = server.noop()[0] == 250
+            except (smtplib.SMTPException, OSError):  # a dropped socket surfaces as OSError, not SMTPException
+                alive = False
+            if not alive:
+                self._discard(server)
+                return self._connect()
+        return server
+
+    def _discard(self, server) -> None:
+        try:
+            server.close()
+        except Exception:
+            pass
+
+    def send(self, message) -> None:
+        with self._slots:
+            server = self._checkout()
+            try:
+                server.send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                # Idle connection dropped by the server: reconnect once and retry
+                self._discard(server)
+                server = self._connect()
+                try:
+                    server.send_message(message)
+                except Exception:
+                    self._discard(server)
+                    raise
+            except Exception:
+                self._discard(server)
+                raise
+            with self._lock:
+                self._idle.append((server, time.monotonic()))
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            try:
+                server.quit()
+            except Exception:
+                self._discard(server)
+
+
+smtp_settings = SMTPSettings.from_env()
+smtp_pool = SMTPConnectionPool(smtp_settings, size=int(os.getenv("SMTP_POOL_SIZE", "2")))
+
+
+def build_message(sender: str, recipient_email: str, subject: str, body: str) -> MIMEMultipart:
+    message = MIMEMultipart()
+    message["From"] = sender
+    message["To"] = recipient_email
+    message["Subject"] = subject
+    message.attach(MIMEText(body, "plain"))
+    return message
+
+
+def deliver_email(recipient_email: str, subject: str, body: str) -> str:
+    """Send one email over the shared connection pool, returning a human readable result"""
+    if smtp_settings.credentials_missing():
+        return "Error: Gmail credentials are missing. Please check your .env file."
+
+    message = build_message(smtp_settings.user, recipient_email, subject, body)
+    try:
+        with span("smtp_delivery", smtp_settings.host):
+            smtp_pool.send(message)
+        return f"Email sent successfully to {recipient_email} from {smtp_settings.user}"
+    except smtplib.SMTPAuthenticationError:
+        return "SMTP Authentication failed. Please check your Gmail credentials and ensure you're using the correct App Password."
+    except smtplib.SMTPException as e:
+        return f"SMTP error occurred: {str(e)}"
+    except Exception as e:
+        return f"Unexpected error occurred: {str(e)}"
+
+
+class MailQueue:
+    """Outbound mail queue: submit() hands back a receipt straight away and workers deliver in the background.
+
+    Delivery runs in threads (smtplib is blocking); status(message_id) reports queued / sending / sent / failed.
+    Statuses are kept in store, a session store, so with the SQLite backend any worker can report a message's
+    status, whichever worker queued it.
+    """
+
+    def __init__(self, deliver=deliver_email, workers: int = 2, store: Optional[SessionStore] = None):
+        self.deliver = deliver
+        self.workers = workers
+        self.store = store or InMemorySessionStore()
+        self._queue = None
+        self._tasks = []
+        self._ids = itertools.count(1)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain: bool = True) -> None:
+        """Stop the workers, by default after delivering everything already queued"""
+        if not self._tasks:
+            return
+        if drain:
+            await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _track(self, record: Dict, **fields) -> None:
+        record.update(fields)
+        try:
+            await asyncio.to_thread(self.store.save_delivery, record["message_id"], dict(record))
+        except Exception:
+            # a status that could not be recorded must not stop the mail from going out
+            logger.exception("Could not record the delivery status of %s", record["message_id"])
+
+    async def submit(self, recipient_email: str, subject: str, body: str) -> Dict:
+        self.start()
+        message_id = f"{next(self._ids)}-{uuid.uuid4().hex[:8]}"
+        record = {"message_id": message_id}
+        await self._track(record, status="queued", recipient_email=recipient_email, subject=subject)
+        self._queue.put_nowait((record, recipient_email, subject, body))
+        return {"message_id": message_id, "status": "queued", "recipient_email": recipient_email}
+
+    async def status(self, message_id: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self.store.get_delivery, message_id)
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            record, recipient_email, subject, body = await self._queue.get()
+            try:
+                await self._track(record, status="sending")
+                result = await loop.run_in_executor(None, self.deliver, recipient_email, subject, body)
+                sent = result.startswith("Email sent successfully")
+                await self._track(record, status="sent" if sent else "failed", result=result)
+            except Exception as e:
+                await self._track(record, status="failed", result=f"Unexpected error occurred: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+
+mail_queue = MailQueue(workers=int(os.getenv("MAIL_QUEUE_WORKERS", "2")))
@@ -1,23 +1,74 @@
+import asyncio
 import json
-import ast
+import logging
 import os
-from openai import AsyncOpenAI
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import List, Optional
 from enum import Enum
 from dotenv import load_dotenv, find_dotenv
 
-from fastapi import FastAPI, APIRouter, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, Request, WebSocket
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
-from tools import get_clients, get_funds, send_email_gmail
+from tools import get_clients, get_clients_bulk, get_funds, get_funds_bulk, search_clients
+from client_repository import CLIENT_FIELDS
+from datasets import DATASET_WATCH_ENABLED, Snapshot, datasets
+from fund_screener import FUND_FIELDS
+from briefings import iter_briefings, select_clients
+from session_store import create_session_store, new_session_id
+from tool_executor import execute_tool_calls, run_blocking_tool, tool_pool
+from tool_registry import ArgumentError, ToolRegistry, argument_error
+from prompt_builder import PromptBuilder, PromptPrefix
+from mailer import mail_queue, smtp_pool
+from context_window import count_message_tokens, create_context_window
+from static_files import StaticSite
+from upstream import UpstreamUnavailable, create_upstream_client
+from loop_guard import TurnGuard
+from intent_router import INTENT_ROUTER_ENABLED, IntentRouter
+from chat_socket import ChatConnection
+from observability import (
+    configure_logging,
+    get_logger,
+    http_requests,
+    log_event,
+    payload_bytes,
+    record_usage,
+    render_metrics,
+    span,
+    span_seconds,
+)
+from cache import (
+    CACHEABLE_TOOLS,
+    cache_stats,
+    completion_cache,
+    completion_cache_enabled,
+    completion_cache_key,
+    invalidate_client_data,
+    invalidate_dataset_results,
+    tool_cache,
+    tool_cache_key,
+)
 
 
 load_dotenv(find_dotenv())
+configure_logging()
+logger = get_logger("main")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await warm_up()
+    yield
+    await shut_down()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 class Industry(str, Enum):
     real_estate = "real estate"
@@ -28,6 +79,8 @@ class Config(BaseModel):
     client_name: str = 'TIAA'
     model: str = 'gpt-4o'
 
+# Deployment default. Requests never mutate it: each one resolves its own Config (see resolve_config),
+# and /erase without a session swaps in a new object rather than editing this one in place.
 config = Config()
 
 
@@ -41,9 +94,17 @@ llm_config = {
     "cache_seed": None
 }
 
-client = AsyncOpenAI()
+upstream = create_upstream_client(llm_config)
+client = upstream.client
 
 MAX_ITER = 50
+# Wall-clock budget for one chat turn; every upstream call's timeout and retry backoff is clipped to it
+REQUEST_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS", "180"))
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "30"))
+
+session_store = create_session_store()
+# delivery statuses live in the session store too, so GET /email/{id} answers on every worker
+mail_queue.store = session_store
 
 # Configure CORS
 origins = [
@@ -53,6 +114,21 @@ origins = [
     "http://localhost:8080",
 ]
 
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # label by route template, not raw path, to keep the series count bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        span_seconds.observe(time.perf_counter() - started, span="request", name=route)
+        http_requests.inc(route=route, method=request.method, status=status)
+
+
 # CORS middleware setup
 app.add_middleware(
     CORSMiddleware,
@@ -78,9 +154,10 @@ Do not reference or repeat information from previous parts of the conversation u
 2. **Avoid Answering Unasked Questions**: Do not provide extra information that was not requested by the user. Be succinct and direct.
 3. **No Repetition of Previous Suggestions**: Avoid reiterating previous suggestions unless requested.
 
-4. Help the user by fetching information about clients using the get_clients tool.
-a. If the user asks about clients in a specific city, provide their name, email, age, profession, and last contact date.
+4. Help the user by fetching information about clients using the get_clients tool (or get_clients_bulk when several cities are involved).
+a. If the user asks about clients in a specific city, provide their name, email, age, profession, and last contact date. Request only those with fields ["name", "email", "age", "profession", "last_contacted_days"]; if the result has a next_cursor, pass it back to get the next page.
 b. If the user asks about a specific client, provide their additional details.
+c. If the user asks which clients mention a topic (e.g. who asked about trusts or 529 plans), use the search_clients tool instead of listing whole cities.
 
 5. If the user is drafting an email, assist them and wait for their confirmation before sending it.
     When drafting an email, always include the following signature at the end of the email body:
@@ -105,46 +182,153 @@ b. If the user asks about a specific client, provide their additional details.
 
 7. When the user asks for fund recommendations for a client:
     a. Based on the client's profile (age, risk tolerance, invested assets, etc.), determine appropriate criteria for fund selection.
-    b. Use the get_funds tool to fetch fund recommendations based on these criteria. The default 'max_expense_ratio' should be 0.001 and the default 'min_rating' should be 3. If the client has a 'High' risk profile, then the 'max_expense_ratio' should be 0.002 and 'min_rating' should be 2.
+    b. Use the get_funds tool to fetch fund recommendations based on these criteria (or get_funds_bulk when recommending for several clients at once). The default 'max_expense_ratio' should be 0.001 and the default 'min_rating' should be 3. If the client has a 'High' risk profile, then the 'max_expense_ratio' should be 0.002 and 'min_rating' should be 2.
     c. Suggest only funds from the list returned by the get_funds tool.
     d. Explain why these funds are suitable for the client's profile.
 Remember, your goal is to be helpful and informative while also being approachable and relatable. Make the user feel like they're talking to a knowledgeable friend rather than a formal financial institution.
 """
 
 
+INDUSTRY_SPECIFIC_CONTENT = {
+    Industry.real_estate: "Focus on real estate investment strategies and market trends.",
+    Industry.wam: "Concentrate on wealth and asset management principles.",
+}
+
+
+def resolve_config(data, base: Config) -> Config:
+    """Config for one request: base (the session's or the deployment default) overridden by clientName/industry in the body.
+
+    Raises ValueError for an unknown industry.
+    """
+    client_name = data.get("clientName") or base.client_name
+    industry = Industry(data["industry"]) if data.get("industry") else base.industry
+    return Config(client_name=client_name, industry=industry, model=base.model)
+
+
+DEFAULT_CONFIG_KEY = "default_config"
+
+
+def default_config() -> Config:
+    """Deployment default as last set by /erase, shared by all worker processes through the session store"""
+    stored = session_store.get_setting(DEFAULT_CONFIG_KEY)
+    return Config(**stored) if stored else config
+
+
+def session_config(session_id: Optional[str]) -> Config:
+    stored = session_store.get_config(session_id) if session_id else None
+    return Config(**stored) if stored else default_config()
+
+
+CACHE_GENERATION_KEY = "cache_generation"
+cache_generation = None  # the /cache/invalidate generation this worker's caches reflect
+
+
+def sync_cache_generation() -> None:
+    """Apply a /cache/invalidate made by any worker: the generation is shared through the session store"""
+    global cache_generation
+    stored = session_store.get_setting(CACHE_GENERATION_KEY)
+    generation = stored["generation"] if stored else None
+    if generation != cache_generation:
+        cache_generation = generation
+        invalidate_client_data()
+
+
+def fields_parameter(names, what: str) -> dict:
+    return {
+        "type": "array",
+        "items": {"type": "string", "enum": list(names)},
+        "description": f"Only return these fields of each {what}; all fields by default",
+    }
+
+
+PAGE_LIMIT_PARAMETER = {
+    "type": "integer",
+    "minimum": 1,
+    "description": "Results come one page at a time, with a next_cursor when there are more; this caps the page size",
+}
+CURSOR_PARAMETER = {
+    "type": "string",
+    "description": "The next_cursor of a previous page, passed with the same other arguments to get the page after it",
+}
+
+
 tools = [
     {
         "type": "function",
         "function": {
-            "name": "get_current_weather",
-            "description": "Get the current weather in a given location",
+            "name": "get_clients",
+            "description": "Get the clients available in a given location",
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "location": {
+                    "city": {
                         "type": "string",
-                        "description": "The city and state, e.g. San Francisco, CA",
+                        "description": "The city name, e.g. San Francisco or Boston",
                     },
-                    "unit": {"type": "string", "enum": ["celsius", "fahrenheit"]},
+                    "fields": fields_parameter(CLIENT_FIELDS, "client"),
+                    "limit": PAGE_LIMIT_PARAMETER,
+                    "cursor": CURSOR_PARAMETER,
                 },
-                "required": ["location"],
+                "required": ["city"],
             },
         },
     },
     {
         "type": "function",
         "function": {
-            "name": "get_clients",
-            "description": "Get the clients available in a given location",
+            "name": "get_clients_bulk",
+            "description": "Get the clients in several locations at once, e.g. to compare clients across cities. Prefer this over repeated get_clients calls.",
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "city": {
+                    "cities": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "The city names, e.g. [\"Boston\", \"Chicago\"]",
+                    },
+                    "risk_profile": {
                         "type": "string",
-                        "description": "The city name, e.g. San Francisco or Boston",
+                        "enum": ["Low", "Moderate", "High"],
+                        "description": "Only return clients with this risk profile",
                     },
+                    "max_last_contacted_days": {
+                        "type": "integer",
+                        "description": "Only return clients contacted within this many days",
+                    },
+                    "fields": fields_parameter(CLIENT_FIELDS, "client"),
                 },
-                "required": ["city"],
+                "required": ["cities"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_clients",
+            "description": "Full-text search over all clients' details and meeting notes, e.g. to find who asked about trusts or 529 plans. Returns the best matches with the matching sentences only.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Words to look for, e.g. \"trusts wills estate\"",
+                    },
+                    "risk_profile": {"type": "string", "enum": ["Low", "Moderate", "High"]},
+                    "min_age": {"type": "integer"},
+                    "max_age": {"type": "integer"},
+                    "max_last_contacted_days": {
+                        "type": "integer",
+                        "description": "Only clients contacted within this many days",
+                    },
+                    "city": {"type": "string"},
+                    "limit": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "maximum": 20,
+                        "description": "How many clients to return, 5 by default",
+                    },
+                },
+                "required": ["query"],
             },
         },
     },
@@ -173,11 +357,70 @@ tools = [
             },
         },
     }, 
+    {
+        "type": "function",
+        "function": {
+            "name": "get_funds_bulk",
+            "description": "Get fund recommendations for several clients at once, one set of criteria per client. Prefer this over repeated get_funds calls.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "profiles": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "label": {
+                                    "type": "string",
+                                    "description": "Who these criteria are for, usually the client's name; results are keyed by it, with a repeated label suffixed \" (2)\", \" (3)\"...",
+                                },
+                                "risk_level": {"type": "string", "enum": ["Low", "Moderate", "High"]},
+                                "min_rating": {"type": "integer", "minimum": 1, "maximum": 5},
+                                "max_expense_ratio": {"type": "number"},
+                                "estimated_available_funds": {"type": "number"},
+                            },
+                            "required": ["label", "risk_level", "min_rating", "max_expense_ratio", "estimated_available_funds"],
+                        },
+                        "description": "One entry per client, with the same criteria get_funds takes",
+                    },
+                    "sort_by": {
+                        "type": "string",
+                        "enum": ["total_return_ytd", "expense_ratio"],
+                        "description": "Optionally rank each client's funds by highest year-to-date return or lowest expense ratio",
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "description": "Optionally return only the top N funds per client",
+                    },
+                    "fields": fields_parameter(FUND_FIELDS, "fund"),
+                },
+                "required": ["profiles"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_email_status",
+            "description": "Check the delivery status of an email queued by send_email_gmail",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "message_id": {
+                        "type": "string",
+                        "description": "The message_id from the send_email_gmail receipt",
+                    },
+                },
+                "required": ["message_id"],
+            },
+        },
+    },
     {
         "type": "function",
         "function": {
             "name": "get_funds",
-            "description": "Get fund recommendations based on given criteria",
+            "description": "Get fund recommendations based on given criteria. When no fund meets them, the page is empty and closest_match holds the nearest fallback fund, which does not meet them.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -200,6 +443,14 @@ tools = [
                         "type": "number",
                         "description": "The estimated amount of cash that the client has available to be invested.",
                     },
+                    "sort_by": {
+                        "type": "string",
+                        "enum": ["total_return_ytd", "expense_ratio"],
+                        "description": "Optionally rank the funds by highest year-to-date return or lowest expense ratio",
+                    },
+                    "fields": fields_parameter(FUND_FIELDS, "fund"),
+                    "limit": PAGE_LIMIT_PARAMETER,
+                    "cursor": CURSOR_PARAMETER,
                 },
                 "required": ["risk_level", "min_rating", "max_expense_ratio", "estimated_available_funds"],
             },
@@ -207,68 +458,260 @@ tools = [
     },
 ]
 
+tool_registry = ToolRegistry()
+
+
+@tool_registry.register("get_clients")
+async def run_get_clients(**arguments):
+    return await run_blocking_tool("get_clients", get_clients, **arguments)
+
+
+@tool_registry.register("get_clients_bulk")
+async def run_get_clients_bulk(**arguments):
+    return await run_blocking_tool("get_clients_bulk", get_clients_bulk, **arguments)
+
+
+@tool_registry.register("search_clients")
+async def run_search_clients(**arguments):
+    return await run_blocking_tool("search_clients", search_clients, **arguments)
+
+
+@tool_registry.register("get_funds")
+async def run_get_funds(**arguments):
+    return await run_blocking_tool("get_funds", get_funds, **arguments)
+
+
+@tool_registry.register("get_funds_bulk")
+async def run_get_funds_bulk(**arguments):
+    return await run_blocking_tool("get_funds_bulk", get_funds_bulk, **arguments)
+
+
+@tool_registry.register("send_email_gmail")
+async def run_send_email_gmail(recipient_email, subject, body):
+    # Queued for background delivery; the model gets a receipt it can check with get_email_status
+    return json.dumps(await mail_queue.submit(recipient_email=recipient_email, subject=subject, body=body))
+
+
+@tool_registry.register("get_email_status")
+async def run_get_email_status(message_id):
+    status = await mail_queue.status(message_id)
+    return json.dumps(status or {"error": f"Unknown message_id: {message_id}"})
+
+
+tool_registry.compile(tools)
+# Only tools with a handler are offered to the model; the prefix built from them is reused verbatim per tenant
+prompt_builder = PromptBuilder(SYSTEM_MESSAGE, INDUSTRY_SPECIFIC_CONTENT, tools, tool_registry.handlers.__contains__)
+
+
 async def call_tool(tool_call):
     function_name = tool_call.function.name
-    arguments = ast.literal_eval(tool_call.function.arguments)
-
-    print('function name', function_name)
-    print('arguments: ', arguments)
-
-    if function_name == "get_clients":
-        return get_clients(city=arguments.get("city"))
-    elif function_name == "send_email_gmail":
-        return send_email_gmail(
-            recipient_email=arguments.get("recipient_email"),
-            subject=arguments.get("subject"),
-            body=arguments.get("body"),
-        )
-    elif function_name == "get_funds":
-        return get_funds(
-            risk_level=arguments.get("risk_level"),
-            min_rating=arguments.get("min_rating"),
-            max_expense_ratio=arguments.get("max_expense_ratio"),
-            estimated_available_funds=arguments.get("estimated_available_funds"),
+    try:
+        arguments = tool_registry.parse(function_name, tool_call.function.arguments)
+    except ArgumentError as e:
+        log_event(logger, logging.INFO, "tool_call_rejected", tool=function_name, problems=len(e.problems))
+        return argument_error(function_name, e)
+
+    # argument values can hold client PII and whole email bodies, so only their names are logged
+    log_event(logger, logging.DEBUG, "tool_call", tool=function_name, arguments=sorted(arguments))
+
+    with span("tool", function_name):
+        cache_key = tool_cache_key(function_name, arguments, datasets.snapshot().version)
+        if cache_key is not None:
+            cached = tool_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        result = await tool_registry.dispatch(function_name, arguments)
+        if cache_key is not None and result is not None:
+            tool_cache.set(cache_key, result)
+    if result is not None:
+        payload_bytes.observe(len(result), kind="tool_result", name=function_name)
+    return result
+
+
+async def summarize_messages(messages, previous_summary=None):
+    """Condense turns that no longer fit the context budget into a few sentences, extending the earlier summary"""
+    transcript = "\n".join(f"{message.get('role')}: {message.get('content')}" for message in messages)
+    if previous_summary:
+        transcript = f"Summary so far: {previous_summary}\n\nConversation since:\n{transcript}"
+    response = await upstream.create_completion(
+        model=config.model,
+        temperature=llm_config["temperature"],
+        messages=[
+            {
+                "role": "system",
+                "content": "Summarize this conversation between a financial advisor and their assistant in a few sentences. "
+                "When a summary so far is given, fold the newer conversation into it. "
+                "Keep client names, figures and any decisions or pending actions.",
+            },
+            {"role": "user", "content": transcript},
+        ],
+    )
+    return response.choices[0].message.content
+
+
+context_window = create_context_window(summarizer=summarize_messages)
+
+BRIEFING_MAX_TOKENS = int(os.getenv("BRIEFING_MAX_TOKENS", "300"))
+BRIEFING_BUDGET_SECONDS = float(os.getenv("BRIEFING_BUDGET_SECONDS", "60"))
+BRIEFING_CONCURRENCY = int(os.getenv("BRIEFING_CONCURRENCY", "4"))
+# Most clients one POST /briefings may cover; larger runs belong to the CLI, which can resume
+BRIEFING_MAX_CLIENTS = int(os.getenv("BRIEFING_MAX_CLIENTS", "200"))
+
+
+async def narrate_briefing(client, findings):
+    """Turn a client's record and the deterministic rule-6 findings into a short meeting briefing"""
+    response = await upstream.create_completion(
+        deadline=time.monotonic() + BRIEFING_BUDGET_SECONDS,
+        model=config.model,
+        temperature=llm_config["temperature"],
+        max_tokens=BRIEFING_MAX_TOKENS,
+        messages=[
+            {
+                "role": "system",
+                "content": "You are preparing a financial advisor for a client meeting. In one short paragraph, recommend "
+                "the topics to raise, grounded only in the client record and the flagged findings given. Cite the figures "
+                "from the findings. Do not list the findings verbatim and do not mention findings that are not flagged.",
+            },
+            {"role": "user", "content": json.dumps({"client": client, "findings": findings})},
+        ],
+    )
+    return response.choices[0].message.content
+
+
+async def call_gpt4(message_history, deadline=None, guard=None, prefix=None):
+    settings = {
+        "model": "gpt-4o",
+        "tools": prefix.tools if prefix else prompt_builder.tools,
+        "tool_choice": guard.tool_choice() if guard else "auto",
+        "temperature": llm_config["temperature"],
+    }
+    if prefix:
+        # lets the upstream route requests sharing this prefix to the same prompt cache
+        settings["prompt_cache_key"] = prefix.key
+
+    messages = await context_window.fit(message_history)
+    cache_key = completion_cache_key(messages, settings) if completion_cache_enabled else None
+    message = completion_cache.get(cache_key) if cache_key else None
+    if message is None:
+        with span("completion", settings["model"]):
+            response = await upstream.create_completion(
+                deadline=deadline, messages=messages, **settings
+            )
+        record_usage(settings["model"], getattr(response, "usage", None))
+        if guard:
+            guard.record_usage(getattr(response, "usage", None))
+        if prefix:
+            prompt_builder.record_usage(prefix, getattr(response, "usage", None))
+        message = response.choices[0].message
+        # A completion is only replayable if re-running its tool calls has no side effects
+        if cache_key and all(tool_call.function.name in CACHEABLE_TOOLS for tool_call in message.tool_calls or []):
+            completion_cache.set(cache_key, message)
+    # print("=======RESPONSE IS THISSSS====", message)
+    # print("=======RESPONSE CONTENT  IS THISSSS====", message.content)
+
+    run_tool = guard.memoize(call_tool) if guard else call_tool
+    for tool_call, function_response in await execute_tool_calls(message.tool_calls, run_tool):
+        message_history.append(
+            {
+                "role": "function",
+                "name": tool_call.function.name,
+                "content": function_response,
+                "tool_call_id": tool_call.id,
+            }
         )
 
-async def call_gpt4(message_history):
+    return message
+
+
+async def call_gpt4_stream(message_history, deadline=None, guard=None, prefix=None):
+    """Streaming counterpart of call_gpt4.
+
+    Yields {"type": "delta"} events as content tokens arrive, reassembles the streamed tool-call
+    fragments, runs the tools, and finishes with a {"type": "message"} event holding the assembled message.
+    """
     settings = {
         "model": "gpt-4o",
-        "tools": tools,
-        "tool_choice": "auto",
-       
+        "tools": prefix.tools if prefix else prompt_builder.tools,
+        "tool_choice": guard.tool_choice() if guard else "auto",
+        "temperature": llm_config["temperature"],
+        "stream": True,
+        "stream_options": {"include_usage": True},
     }
+    if prefix:
+        settings["prompt_cache_key"] = prefix.key
 
-    response = await client.chat.completions.create(
-        messages=message_history, **settings
+    started = time.perf_counter()
+    stream = await upstream.create_completion(
+        deadline=deadline, messages=await context_window.fit(message_history), **settings
     )
 
-    message = response.choices[0].message
-    # print("=======RESPONSE IS THISSSS====", message)
-    # print("=======RESPONSE CONTENT  IS THISSSS====", message.content)
+    content_parts = []
+    # Tool calls arrive as fragments keyed by index: the id and name come first, the arguments in pieces
+    partial_tool_calls = {}
+    async for chunk in stream:
+        # with include_usage the last chunk carries the usage and no choices
+        record_usage(settings["model"], getattr(chunk, "usage", None))
+        if guard:
+            guard.record_usage(getattr(chunk, "usage", None))
+        if prefix:
+            prompt_builder.record_usage(prefix, getattr(chunk, "usage", None))
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content_parts.append(delta.content)
+            yield {"type": "delta", "content": delta.content}
+        for fragment in delta.tool_calls or []:
+            partial = partial_tool_calls.setdefault(
+                fragment.index, {"id": None, "type": "function", "name": "", "arguments": ""}
+            )
+            if fragment.id:
+                partial["id"] = fragment.id
+            if fragment.type:
+                partial["type"] = fragment.type
+            if fragment.function:
+                partial["name"] += fragment.function.name or ""
+                partial["arguments"] += fragment.function.arguments or ""
+
+    span_seconds.observe(time.perf_counter() - started, span="completion_stream", name=settings["model"])
+
+    tool_calls = [
+        SimpleNamespace(
+            id=partial["id"],
+            type=partial["type"],
+            function=SimpleNamespace(name=partial["name"], arguments=partial["arguments"]),
+        )
+        for _, partial in sorted(partial_tool_calls.items())
+    ]
 
-    for tool_call in message.tool_calls or []:
+    for tool_call in tool_calls:
         if tool_call.type == "function":
-            function_response = await call_tool(tool_call)
-            message_history.append(
-                {
-                    "role": "function",
-                    "name": tool_call.function.name,
-                    "content": function_response,
-                    "tool_call_id": tool_call.id,
-                }
-            )
+            yield {"type": "tool_call", "name": tool_call.function.name, "tool_call_id": tool_call.id}
 
-    return message
+    run_tool = guard.memoize(call_tool) if guard else call_tool
+    for tool_call, function_response in await execute_tool_calls(tool_calls, run_tool):
+        message_history.append(
+            {
+                "role": "function",
+                "name": tool_call.function.name,
+                "content": function_response,
+                "tool_call_id": tool_call.id,
+            }
+        )
+        yield {"type": "tool_result", "name": tool_call.function.name, "tool_call_id": tool_call.id}
 
+    message = SimpleNamespace(content="".join(content_parts) or None, tool_calls=tool_calls or None)
+    yield {"type": "message", "message": message}
 
-message_history = []
 
 @app.post("/erase")
 async def erase_history(request: Request):
-    global message_history, config
+    global config
     data = await request.json()
     new_client_name = data.get("clientName")
     new_industry = data.get("industry")
+    session_id = data.get("session_id")
 
 ### ---- HANDLING CLIENT NAME UPDATE HERE ---- ##
     if not new_client_name:
@@ -276,65 +719,79 @@ async def erase_history(request: Request):
             status_code=400,
             content={"error": "ClientName is required!!"}
         )
-  # Update the client name
-# current_client_name = new_client_name
-    config.client_name = new_client_name
 
 ### ---- HANDLING INDUSTRY TOGGLE HERE ---- ##
-    if new_industry:
-        try:
-            config.industry = Industry(new_industry)
-        except ValueError:
-            return JSONResponse(
-                status_code=400,
-                content={"error": f"Invalid industry: {new_industry}. Must be 'real estate' or 'wam' only!!"}
-            )
-  # Erase the message history
-    message_history = []
-    print(f"History erased and configuration updated. Client name: {config.client_name}, Industry: {config.industry}")
-    print("UPDATED HISTORY AFTER ERASING THE HISTORY", message_history)
+    try:
+        new_config = resolve_config(data, await asyncio.to_thread(session_config, session_id))
+    except ValueError:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Invalid industry: {new_industry}. Must be 'real estate' or 'wam' only!!"}
+        )
+
+  # Erase the message history; a session keeps its own configuration, otherwise the deployment default is replaced
+    if session_id:
+        await asyncio.to_thread(session_store.delete, session_id)
+        await asyncio.to_thread(session_store.save_config, session_id, new_config.model_dump(mode="json"))
+    else:
+        config = new_config
+        await asyncio.to_thread(session_store.save_setting, DEFAULT_CONFIG_KEY, new_config.model_dump(mode="json"))
+    log_event(logger, logging.INFO, "history_erased", session=bool(session_id), industry=new_config.industry.value)
 
 
     return JSONResponse(content={
         "message": "History erased and client name updated",
-        "clientName": config.client_name,
-        "industry": config.industry
+        "clientName": new_config.client_name,
+        "industry": new_config.industry
     })
 
-@app.post("/chat")
-async def chat(request: Request):
-   
-    # Function to update the system message with the new client name
-    def update_system_message():
-        industry_specific_content = ""
-        if config.industry == Industry.real_estate:
-            industry_specific_content = "Focus on real estate investment strategies and market trends."
-        elif config.industry == Industry.wam:
-            industry_specific_content = "Concentrate on wealth and asset management principles."
-        return {
-            "role": "system",
-            "content": SYSTEM_MESSAGE.format(client_name=config.client_name, industry_specific_content=industry_specific_content)
 
-    }
-    data = await request.json()
+@dataclass
+class ChatTurn:
+    session_id: Optional[str]
+    message_history: List[dict]
+    turn_start: int
+    config: Config
+    deadline: float
+    guard: TurnGuard
+    prefix: PromptPrefix
+    snapshot: Snapshot  # the data every tool call of this turn reads
+
+def load_session(session_id: Optional[str]):
+    """Stored history and config of a session (the deployment default without one); blocking, so run it in a thread"""
+    sync_cache_generation()
+    message_history = session_store.get(session_id) if session_id else None
+    return message_history, session_config(session_id)
+
+
+async def prepare_message_history(data):
+    """Build the message history for a /chat request, with the system message up front and the new user turn appended.
+
+    When the request carries no message_history the conversation lives in the session store: it is loaded by
+    session_id (a new session is started if that is missing) and the client only ever sends the new message.
+    The session id is None for the legacy full-history contract. Configuration is resolved once here and
+    carried on the returned ChatTurn, so nothing later in the tool loop reads shared mutable state.
+    """
     user_message = data.get("message", "")
     client_name = data.get("clientName", "")
 
 
-    print(f"User Message: {user_message}")
-    print(f"Current client name: {client_name}")
+    log_event(logger, logging.INFO, "chat_turn", message_chars=len(user_message), client_name_given=bool(client_name))
 
-     # Update config if a new client name is provided
-    if client_name and client_name != config.client_name:
-        config.client_name = client_name
-        print(f"Updated client name in config: {config.client_name}")
+    session_id = None if "message_history" in data else data.get("session_id") or new_session_id()
+    stored_history, base_config = await asyncio.to_thread(load_session, session_id)
+    if session_id is None:
+        message_history = data.get("message_history") or []
+    else:
+        message_history = stored_history or []
 
+    request_config = resolve_config(data, base_config)
+    if session_id and request_config != base_config:
+        await asyncio.to_thread(session_store.save_config, session_id, request_config.model_dump(mode="json"))
 
      # Create or update the system message with the current client name
-    system_message = update_system_message()
-    # print(f"Updated System Message: {system_message}")
-
-    message_history = data.get("message_history",[])
+    prefix = prompt_builder.prefix(request_config.client_name, request_config.industry)
+    system_message = prefix.system_message()
 
 
       # Check if the first message in history is already the system message
@@ -350,47 +807,327 @@ async def chat(request: Request):
     # print("THIS IS THE MESSAGE HISTORY", message_history)
     # print("this is the client name in the sustem message", client_name)
 
+    turn_start = len(message_history)
     message_history.append({"role": "user", "content": user_message})
+    return ChatTurn(
+        session_id,
+        message_history,
+        turn_start,
+        request_config,
+        time.monotonic() + REQUEST_BUDGET_SECONDS,
+        TurnGuard.from_env(MAX_ITER),
+        prefix,
+        datasets.pin(),
+    )
+
+
+async def finish_turn(turn: ChatTurn, response):
+    """Response body for a completed turn: the full history for legacy callers, only the new messages for sessions"""
+    if turn.session_id is None:
+        return {
+            "response": response,
+            "message_history": turn.message_history,
+            "clientName": turn.config.client_name,
+        }
+    await asyncio.to_thread(session_store.save, turn.session_id, turn.message_history)
+    return {
+        "response": response,
+        "session_id": turn.session_id,
+        "messages": turn.message_history[turn.turn_start:],
+        "clientName": turn.config.client_name,
+    }
+
+
+intent_router = IntentRouter(lambda: datasets.snapshot().clients)
+# results cached from the previous snapshot would outlive it otherwise; their keys carry the version as well
+datasets.on_swap(lambda snapshot: invalidate_dataset_results())
+
+
+async def route_turn(turn: ChatTurn) -> Optional[str]:
+    """Answer a plain lookup without the model when the intent router is enabled and confident about it.
+
+    The tool result and the reply are appended to the history just as a model turn would leave them, so
+    follow-up questions have the same context either way. Returns None when the model should take the turn.
+    """
+    user_message = turn.message_history[-1].get("content")
+    if not INTENT_ROUTER_ENABLED or not isinstance(user_message, str):
+        return None
+    tool_call_id = f"route_{uuid.uuid4().hex[:12]}"
+
+    async def routed_tool_call(function_name, arguments):
+        # through call_tool, so routed lookups share the argument checks and result cache with the model's
+        return await call_tool(SimpleNamespace(
+            id=tool_call_id, type="function", function=SimpleNamespace(name=function_name, arguments=json.dumps(arguments)),
+        ))
+
+    with span("intent_router"):
+        answered = await intent_router.answer(user_message, routed_tool_call)
+    if answered is None:
+        return None
+    route, result, reply = answered
+    log_event(logger, logging.INFO, "intent_routed", intent=route.intent, confidence=round(route.confidence, 3))
+    turn.message_history.append({"role": "function", "name": route.tool, "content": result, "tool_call_id": tool_call_id})
+    turn.message_history.append({"role": "assistant", "content": reply})
+    return reply
+
+
+@app.post("/chat")
+async def chat(request: Request):
+    data = await request.json()
+    try:
+        turn = await prepare_message_history(data)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": f"Invalid industry: {data.get('industry')}"})
+    message_history = turn.message_history
+
+    reply = await route_turn(turn)
+    if reply is not None:
+        return JSONResponse(content=await finish_turn(turn, reply))
 
     cur_iter = 0
     while cur_iter < MAX_ITER:
-        message = await call_gpt4(message_history)
+        try:
+            message = await call_gpt4(message_history, deadline=turn.deadline, guard=turn.guard, prefix=turn.prefix)
+        except UpstreamUnavailable as e:
+            return JSONResponse(status_code=503, content={"error": str(e)})
         if not message.tool_calls:
             assistant_message = {"role": "assistant", "content": message.content}
             # message_history.append({"role": "assistant", "content": message.content})
             message_history.append(assistant_message)
-            return JSONResponse(content={
-                "response": message.content, 
-                "message_history": message_history,
-                "clientName": config.client_name 
-                })
+            with span("serialize", "chat_response"):
+                response = JSONResponse(content=await finish_turn(turn, message.content))
+            payload_bytes.observe(len(response.body), kind="response", name="/chat")
+            return response
+        if turn.guard.forced:
+            break
+        turn.guard.next_iteration()
         cur_iter += 1
 
     return JSONResponse(content={"error": "Maximum iterations reached"})
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+
+def ndjson_frame(frame):
+    return json.dumps(frame) + "\n"
+
+
+async def turn_events(turn: ChatTurn):
+    """The streamed tool loop for one prepared turn, as event dicts ending in a "done" or "error" event.
+
+    A failure anywhere in the turn still ends it with an "error" event, so a client never sees the stream stop
+    without one.
+    """
+    try:
+        async for event in stream_turn(turn):
+            yield event
+    except Exception as e:
+        logger.exception("Streamed chat turn failed")
+        yield {"type": "error", "error": f"{type(e).__name__}: {e}"}
+
+
+async def stream_turn(turn: ChatTurn):
+    reply = await route_turn(turn)
+    if reply is not None:
+        yield {"type": "delta", "content": reply}
+        yield {"type": "done", **await finish_turn(turn, reply)}
+        return
+
+    message_history = turn.message_history
+    cur_iter = 0
+    while cur_iter < MAX_ITER:
+        message = None
+        try:
+            async for event in call_gpt4_stream(message_history, deadline=turn.deadline, guard=turn.guard, prefix=turn.prefix):
+                if event["type"] == "message":
+                    message = event["message"]
+                else:
+                    yield event
+        except UpstreamUnavailable as e:
+            yield {"type": "error", "error": str(e)}
+            return
+        if not message.tool_calls:
+            message_history.append({"role": "assistant", "content": message.content})
+            yield {
+                "type": "done",
+                **await finish_turn(turn, message.content),
+            }
+            return
+        if turn.guard.forced:
+            break
+        turn.guard.next_iteration()
+        cur_iter += 1
+
+    yield {"type": "error", "error": "Maximum iterations reached"}
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
+    """Same contract as /chat, but streamed as newline-delimited JSON frames.
+
+    Frames are {"type": "delta"} for assistant tokens, {"type": "tool_call"} / {"type": "tool_result"}
+    around each tool run, and a closing {"type": "done"} frame carrying the same body /chat would return
+    (or {"type": "error"} if the loop gives up).
+    """
+    data = await request.json()
+    try:
+        turn = await prepare_message_history(data)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": f"Invalid industry: {data.get('industry')}"})
+
+    async def frames():
+        async for event in turn_events(turn):
+            yield ndjson_frame(event)
+
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
+
+
+async def socket_turn(data):
+    """One chat turn for the WebSocket transport: a "started" event with the session id, then turn_events"""
+    try:
+        turn = await prepare_message_history(data)
+    except ValueError:
+        yield {"type": "error", "error": f"Invalid industry: {data.get('industry')}"}
+        return
+    yield {"type": "started", "session_id": turn.session_id}
+    async for event in turn_events(turn):
+        yield event
+
+
+@app.websocket("/chat/ws")
+async def chat_socket(websocket: WebSocket):
+    """Persistent chat connection multiplexing turns for several sessions; see chat_socket.ChatConnection"""
+    await ChatConnection(websocket, socket_turn, origins).serve()
+
+static_site = StaticSite("static")
+
+@app.post("/briefings")
+async def briefings(request: Request):
+    """Meeting briefings for every selected client, streamed as newline-delimited JSON as each one completes.
+
+    Body: {"cities": [...], "clients": [...], "narrative": true}. Without cities or clients the caller must ask for
+    the whole book with "all": true, and a selection of more than BRIEFING_MAX_CLIENTS clients is refused.
+    """
+    data = await request.json()
+    if not (data.get("cities") or data.get("clients") or data.get("all") is True):
+        return JSONResponse(
+            status_code=400,
+            content={"error": 'Select "cities" or "clients", or pass "all": true for the whole book'},
+        )
+    items = await asyncio.to_thread(select_clients, data.get("cities"), data.get("clients"), BRIEFING_MAX_CLIENTS + 1)
+    if len(items) > BRIEFING_MAX_CLIENTS:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"More than {BRIEFING_MAX_CLIENTS} clients selected; narrow the selection or use python -m briefings"},
+        )
+    narrator = narrate_briefing if data.get("narrative", True) else None
+
+    async def frames():
+        records = iter_briefings(items, narrator, BRIEFING_CONCURRENCY)
+        try:
+            async for record in records:
+                yield ndjson_frame(record)
+        finally:
+            # a client that hangs up mid-stream should not leave narratives being written for nobody
+            await records.aclose()
+
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
+
+
+@app.get('/email/{message_id}')
+async def email_status(message_id: str):
+    status = await mail_queue.status(message_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown message_id: {message_id}"})
+    return status
+
+@app.get('/cache')
+async def cache_status():
+    return {**cache_stats(), "prompt_prefixes": prompt_builder.stats()}
+
+@app.get('/router')
+async def router_status():
+    return intent_router.stats()
+
+@app.post('/cache/invalidate')
+async def cache_invalidate():
+    """Call after the client book changes so no cached tool result or completion serves stale client data.
+
+    Other workers see the new generation in the session store and drop their caches at the start of their next turn.
+    """
+    global cache_generation
+    cache_generation = new_session_id()
+    await asyncio.to_thread(session_store.save_setting, CACHE_GENERATION_KEY, {"generation": cache_generation})
+    return {"invalidated": invalidate_client_data()}
+
+@app.get('/datasets')
+async def dataset_status():
+    return datasets.status()
+
+@app.post('/datasets/reload')
+async def dataset_reload():
+    """Reload the client and fund files now instead of waiting for the watcher"""
+    swapped = await asyncio.to_thread(datasets.reload, True)
+    return {"swapped": swapped, **datasets.status()}
+
+@app.get('/metrics')
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.get('/health')
 async def health_check():
     return {'status': 'ok'}
 
 @app.get('/')
-async def serve_root():
-    static_folder = 'static'  # Update this if your static folder has a different name
-    print("Static folder path:", static_folder)
-    print("Index.html exists:", os.path.isfile(os.path.join(static_folder, 'index.html')))
-    return FileResponse(os.path.join(static_folder, 'index.html'))
+async def serve_root(request: Request):
+    return static_site.serve('index.html', request.headers)
 
 @app.get('/{full_path:path}')
-async def serve_app(full_path: str):
-    static_folder = 'static'  # Update this if your static folder has a different name
-    file_path = os.path.join(static_folder, full_path)
-    if os.path.isfile(file_path):
-        return FileResponse(file_path)
-    else:
-        return FileResponse(os.path.join(static_folder, 'index.html'))
+async def serve_app(full_path: str, request: Request):
+    return static_site.serve(full_path, request.headers)
+
+
+async def warm_up():
+    """Fill the per-query client cache, the fund screener and the prompt prefixes before the worker takes traffic"""
+    global cache_generation
+    started = time.perf_counter()
+    datasets.snapshot().clients.warm()
+    get_funds("Low", 1, 1.0, 0)
+    # the caches were just filled from current data, so the current generation counts as applied
+    stored = session_store.get_setting(CACHE_GENERATION_KEY)
+    cache_generation = stored["generation"] if stored else None
+    base = default_config()
+    for industry in Industry:
+        count_message_tokens(prompt_builder.prefix(base.client_name, industry).system_message())
+    mail_queue.start()
+    if DATASET_WATCH_ENABLED:
+        datasets.watch()
+    log_event(logger, logging.INFO, "warm_up", seconds=round(time.perf_counter() - started, 3))
+
+
+async def shut_down():
+    """Drain what outlives the requests: uvicorn has already waited for in-flight chat turns and their tool loops"""
+    try:
+        await asyncio.wait_for(mail_queue.stop(drain=True), timeout=SHUTDOWN_DRAIN_SECONDS)
+    except asyncio.TimeoutError:
+        log_event(logger, logging.WARNING, "mail_queue_not_drained", timeout_seconds=SHUTDOWN_DRAIN_SECONDS)
+        await mail_queue.stop(drain=False)
+    # tool threads that timed out may still be running; let them finish rather than kill them mid-write
+    await asyncio.to_thread(tool_pool.shutdown, wait=True, cancel_futures=True)
+    smtp_pool.close()
+    await asyncio.to_thread(datasets.stop)
+    await upstream.client.close()
+    session_store.close()
+    log_event(logger, logging.INFO, "shut_down")
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
+
+    workers = int(os.getenv("WORKERS", "1"))
+    uvicorn.run(
+        # several workers need an import string so each process can load the app itself
+        "main:app" if workers > 1 else app,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8080")),
+        workers=workers,
+        timeout_graceful_shutdown=SHUTDOWN_DRAIN_SECONDS,
+    )
\ No newline at end of file
@@ -0,0 +1,193 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence, Tuple
+
+
+# ---- Structured, non-blocking logging ---- #
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, event, plus whatever fields were passed"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_listener = None
+
+
+def configure_logging(level: Optional[str] = None) -> None:
+    """Route the app's loggers through a queue, so request handlers never wait on stdout"""
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter())
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger("advisor")
+    root.setLevel(level or os.getenv("LOG_LEVEL", "INFO"))
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"advisor.{name}")
+
+
+def log_event(logger: logging.Logger, level: int, event: str, **fields) -> None:
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+# ---- Prometheus metrics ---- #
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value:g}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[LabelValues, list] = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[position] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            for bound, count in zip(self.buckets, values):
+                le = f'le="{bound:g}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {values[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {values[-2]:g}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {values[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+span_seconds = registry.register(Histogram(
+    "advisor_span_seconds", "Duration of instrumented sections of the request path", ("span", "name"),
+))
+span_errors = registry.register(Counter(
+    "advisor_span_errors_total", "Instrumented sections that raised", ("span", "name"),
+))
+http_requests = registry.register(Counter(
+    "advisor_http_requests_total", "HTTP requests served", ("route", "method", "status"),
+))
+completion_tokens = registry.register(Counter(
+    "advisor_completion_tokens_total", "Tokens reported in upstream completion usage", ("model", "kind"),
+))
+payload_bytes = registry.register(Histogram(
+    "advisor_payload_bytes", "Size of serialized payloads", ("kind", "name"),
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576),
+))
+
+
+@contextmanager
+def span(kind: str, name: str = ""):
+    """Time a section of the hot path into advisor_span_seconds{span=kind, name=name}"""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        span_errors.inc(span=kind, name=name)
+        raise
+    finally:
+        span_seconds.observe(time.perf_counter() - started, span=kind, name=name)
+
+
+def record_usage(model: str, usage) -> None:
+    """Count prompt/completion/cached tokens from a completion's usage field"""
+    if usage is None:
+        return
+    completion_tokens.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model, kind="prompt")
+    completion_tokens.inc(getattr(usage, "completion_tokens", 0) or 0, model=model, kind="completion")
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) if details is not None else 0
+    completion_tokens.inc(cached or 0, model=model, kind="cached_prompt")
+
+
+def render_metrics() -> str:
+    return registry.render()
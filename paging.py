@@ -0,0 +1,75 @@
+import base64
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+
+# Most records one page of a tool result holds, whatever limit the model asks for
+MAX_PAGE_SIZE = int(os.getenv("TOOL_MAX_PAGE_SIZE", "50"))
+
+
+class CursorError(ValueError):
+    """A cursor that was not issued for this query, or for data that has since been reloaded"""
+
+
+def query_fingerprint(function_name: str, arguments: dict) -> str:
+    """Identifies a query by everything but its paging arguments, so a cursor only continues the query it came from"""
+    query = {name: value for name, value in arguments.items() if name not in ("limit", "cursor") and value is not None}
+    return hashlib.sha1(json.dumps([function_name, query], sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def encode_cursor(fingerprint: str, offset: int, limit: int, version: int) -> str:
+    raw = json.dumps([fingerprint, offset, limit, version], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str, version: int):
+    """(offset, limit) the cursor continues from, checked against the query and data version it is used with"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        issued_for, offset, limit, issued_version = json.loads(raw)
+        offset, limit = int(offset), int(limit)
+        if offset < 0 or limit < 1:
+            raise ValueError(offset, limit)
+    except (ValueError, TypeError):
+        raise CursorError("cursor is not one this tool returned") from None
+    if issued_for != fingerprint:
+        raise CursorError("cursor belongs to a different query; repeat the original arguments with it")
+    if issued_version != version:
+        raise CursorError("the data was reloaded since this cursor was issued; start again without a cursor")
+    return offset, limit
+
+
+def page_json(
+    key: str,
+    records: List[str],
+    fingerprint: str,
+    version: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    extra: Optional[Dict[str, str]] = None,
+) -> str:
+    """One page of already-serialized records as {key: [...], "next_cursor": ..., "total": n}.
+
+    The records are joined as they are, so a page costs a slice and a join, not a re-serialization. Pages hold
+    limit records, MAX_PAGE_SIZE when no limit is given. extra adds already-serialized values under their keys.
+    """
+    offset = 0
+    if cursor:
+        offset, cursor_limit = decode_cursor(cursor, fingerprint, version)
+        limit = limit or cursor_limit
+    limit = max(1, min(limit or MAX_PAGE_SIZE, MAX_PAGE_SIZE))
+    window = records[offset:offset + limit]
+    end = offset + len(window)
+    next_cursor = encode_cursor(fingerprint, end, limit, version) if end < len(records) else None
+    extra = "".join(f", {json.dumps(name)}: {value}" for name, value in (extra or {}).items())
+    return (
+        f'{{{json.dumps(key)}: [{", ".join(window)}], '
+        f'"next_cursor": {json.dumps(next_cursor)}, "total": {len(records)}{extra}}}'
+    )
+
+
+def normalize_fields(fields: Optional[Iterable[str]]) -> Optional[frozenset]:
+    """Requested fields as a hashable set, or None (every field) when none were asked for"""
+    return frozenset(fields) if fields else None
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List
+
+from observability import Counter, registry
+
+
+prompt_cache_tokens = registry.register(Counter(
+    "advisor_prompt_cache_tokens_total", "Prompt tokens per prompt prefix, and how many of them the upstream served from its cache", ("industry", "kind"),
+))
+
+
+@dataclass(frozen=True)
+class PromptPrefix:
+    """The part of every request that must not change between turns: system prompt and tool schemas"""
+    key: str  # fingerprint of the prefix, sent upstream as prompt_cache_key
+    industry: str
+    system_content: str
+    tools: List[dict]
+
+    def system_message(self) -> dict:
+        return {"role": "system", "content": self.system_content}
+
+
+class PromptBuilder:
+    """Builds one byte-stable prompt prefix per (client_name, industry) and tracks upstream prefix-cache hits.
+
+    The prefix is rendered once and reused verbatim, and only tools with a registered handler are exposed, so
+    every request for the same tenant starts with identical bytes and the upstream prompt cache can serve them.
+    Everything that varies per turn (summaries, history, the new user message) comes after it.
+    """
+
+    def __init__(self, template: str, industry_content: Dict, tools: List[dict], is_registered: Callable[[str], bool]):
+        self.template = template
+        self.industry_content = industry_content
+        self.tools = [tool for tool in tools if is_registered(tool["function"]["name"])]
+        self._tools_json = json.dumps(self.tools, sort_keys=True, separators=(",", ":"))
+        self.prefix = lru_cache(maxsize=256)(self._build_prefix)
+        self._lock = threading.Lock()
+        self._usage = defaultdict(lambda: {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0})
+
+    def _build_prefix(self, client_name: str, industry) -> PromptPrefix:
+        system_content = self.template.format(
+            client_name=client_name,
+            industry_specific_content=self.industry_content.get(industry, ""),
+        )
+        key = hashlib.sha256((system_content + "\0" + self._tools_json).encode()).hexdigest()[:24]
+        return PromptPrefix(key, getattr(industry, "value", str(industry)), system_content, self.tools)
+
+    def record_usage(self, prefix: PromptPrefix, usage) -> None:
+        """Count how much of the prompt the upstream served from its prefix cache (usage.prompt_tokens_details)"""
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", 0) if details is not None else 0) or 0
+        prompt_cache_tokens.inc(prompt_tokens, industry=prefix.industry, kind="prompt")
+        prompt_cache_tokens.inc(cached_tokens, industry=prefix.industry, kind="cached")
+        with self._lock:
+            stats = self._usage[prefix.key]
+            stats["requests"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_tokens"] += cached_tokens
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                key: {
+                    **stats,
+                    "hit_rate": round(stats["cached_tokens"] / stats["prompt_tokens"], 4) if stats["prompt_tokens"] else 0.0,
+                }
+                for key, stats in self._usage.items()
+            }
@@ -0,0 +1,278 @@
+import abc
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+class SessionStore(abc.ABC):
+    """Server-side conversation store keyed by session id"""
+
+    @abc.abstractmethod
+    def get(self, session_id: str) -> Optional[List[Dict]]:
+        ...
+
+    @abc.abstractmethod
+    def save(self, session_id: str, message_history: List[Dict]) -> None:
+        ...
+
+    @abc.abstractmethod
+    def get_config(self, session_id: str) -> Optional[Dict]:
+        ...
+
+    @abc.abstractmethod
+    def save_config(self, session_id: str, config: Dict) -> None:
+        ...
+
+    @abc.abstractmethod
+    def delete(self, session_id: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    def get_setting(self, key: str) -> Optional[Dict]:
+        """Deployment-wide values (such as the default config) that every worker must agree on"""
+        ...
+
+    @abc.abstractmethod
+    def save_setting(self, key: str, value: Dict) -> None:
+        ...
+
+    @abc.abstractmethod
+    def get_delivery(self, message_id: str) -> Optional[Dict]:
+        """Delivery status of a queued email, readable by every worker whichever one sends it"""
+        ...
+
+    @abc.abstractmethod
+    def save_delivery(self, message_id: str, status: Dict) -> None:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    """LRU of session histories and configs, each expiring ttl_seconds after its last write"""
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 3600, max_deliveries: int = 10000):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_deliveries = max_deliveries
+        self._sessions = OrderedDict()
+        self._settings: Dict[str, Dict] = {}
+        self._deliveries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, session_id: str) -> Optional[Dict]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        if entry["expires_at"] < time.monotonic():
+            del self._sessions[session_id]
+            return None
+        self._sessions.move_to_end(session_id)
+        return entry
+
+    def _put(self, session_id: str, **fields) -> None:
+        entry = self._entry(session_id) or {"message_history": [], "config": None}
+        entry.update(fields, expires_at=time.monotonic() + self.ttl_seconds)
+        self._sessions[session_id] = entry
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def get(self, session_id: str) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._entry(session_id)
+            return list(entry["message_history"]) if entry else None
+
+    def save(self, session_id: str, message_history: List[Dict]) -> None:
+        with self._lock:
+            self._put(session_id, message_history=list(message_history))
+
+    def get_config(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entry(session_id)
+            return entry["config"] if entry else None
+
+    def save_config(self, session_id: str, config: Dict) -> None:
+        with self._lock:
+            self._put(session_id, config=dict(config))
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def get_setting(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            value = self._settings.get(key)
+            return dict(value) if value is not None else None
+
+    def save_setting(self, key: str, value: Dict) -> None:
+        with self._lock:
+            self._settings[key] = dict(value)
+
+    def get_delivery(self, message_id: str) -> Optional[Dict]:
+        with self._lock:
+            status = self._deliveries.get(message_id)
+            return dict(status) if status is not None else None
+
+    def save_delivery(self, message_id: str, status: Dict) -> None:
+        with self._lock:
+            self._deliveries[message_id] = dict(status)
+            self._deliveries.move_to_end(message_id)
+            while len(self._deliveries) > self.max_deliveries:
+                self._deliveries.popitem(last=False)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session histories and configs persisted to a local SQLite file, so they survive restarts.
+
+    The file is opened in WAL mode so several worker processes can share it: readers never block the writer,
+    and a writer waits up to busy_timeout_ms for another process's write instead of failing. Expired sessions
+    and email delivery statuses that are never read again are deleted at open and then once every purge_every
+    writes.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 3600, busy_timeout_ms: int = 5000, purge_every: int = 100):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=busy_timeout_ms / 1000)
+        self._conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, message_history TEXT NOT NULL, config TEXT, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS deliveries (message_id TEXT PRIMARY KEY, status TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.purge()
+
+    def purge(self) -> int:
+        """Delete every expired session and delivery status and return how many there were"""
+        with self._lock:
+            return self._purge()
+
+    def _purge(self) -> int:
+        now = time.time()
+        deleted = self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,)).rowcount
+        deleted += self._conn.execute("DELETE FROM deliveries WHERE expires_at < ?", (now,)).rowcount
+        self._conn.commit()
+        return deleted
+
+    def _wrote(self) -> None:
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            self._purge()
+
+    def _row(self, session_id: str):
+        row = self._conn.execute(
+            "SELECT message_history, config, expires_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[2] < time.time():
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+            return None
+        return row
+
+    def _upsert(self, session_id: str, column: str, value: str) -> None:
+        # column is always one of our own literals, never caller input
+        expires_at = time.time() + self.ttl_seconds
+        self._row(session_id)  # drops the row if it has expired
+        self._conn.execute(
+            "INSERT OR IGNORE INTO sessions (session_id, message_history, expires_at) VALUES (?, '[]', ?)",
+            (session_id, expires_at),
+        )
+        self._conn.execute(
+            f"UPDATE sessions SET {column} = ?, expires_at = ? WHERE session_id = ?",
+            (value, expires_at, session_id),
+        )
+        self._conn.commit()
+        self._wrote()
+
+    def get(self, session_id: str) -> Optional[List[Dict]]:
+        with self._lock:
+            row = self._row(session_id)
+            return json.loads(row[0]) if row else None
+
+    def save(self, session_id: str, message_history: List[Dict]) -> None:
+        with self._lock:
+            self._upsert(session_id, "message_history", json.dumps(message_history))
+
+    def get_config(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._row(session_id)
+            return json.loads(row[1]) if row and row[1] else None
+
+    def save_config(self, session_id: str, config: Dict) -> None:
+        with self._lock:
+            self._upsert(session_id, "config", json.dumps(config))
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def get_setting(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+            return json.loads(row[0]) if row else None
+
+    def save_setting(self, key: str, value: Dict) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+            self._conn.commit()
+
+    def get_delivery(self, message_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status FROM deliveries WHERE message_id = ? AND expires_at >= ?", (message_id, time.time())
+            ).fetchone()
+            return json.loads(row[0]) if row else None
+
+    def save_delivery(self, message_id: str, status: Dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO deliveries (message_id, status, expires_at) VALUES (?, ?, ?)",
+                (message_id, json.dumps(status), time.time() + self.ttl_seconds),
+            )
+            self._conn.commit()
+            self._wrote()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_session_store() -> SessionStore:
+    """Pick the session backend from SESSION_BACKEND ("memory" or "sqlite").
+
+    With more than one worker process the in-memory store would give each process its own sessions, so the
+    default becomes sqlite.
+    """
+    default_backend = "sqlite" if int(os.getenv("WORKERS", "1")) > 1 else "memory"
+    backend = os.getenv("SESSION_BACKEND", default_backend)
+    ttl_seconds = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.getenv("SESSION_DB_PATH", "sessions.db"), ttl_seconds=ttl_seconds)
+    return InMemorySessionStore(
+        max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "1000")),
+        ttl_seconds=ttl_seconds,
+    )
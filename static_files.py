@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from typing import Dict, Optional
+
+from fastapi.responses import FileResponse, Response
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are built at startup
+    brotli = None
+
+
+# Build tools put a content hash in the file name, e.g. main.65be0789.js; those never change in place
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.")
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/xml")
+MIN_COMPRESS_BYTES = 1024
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding as content-coding -> q-value (1 when not given); q=0 means the client refuses that coding"""
+    accepted = {}
+    for item in header.split(","):
+        coding, _, parameters = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for parameter in parameters.split(";"):
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_encoding(variants: Dict[str, bytes], header: str) -> Optional[str]:
+    """The variant the client weighs highest (brotli on a tie), or None for the identity body"""
+    accepted = accepted_encodings(header)
+    chosen, best = None, 0.0
+    for encoding in ("br", "gzip"):
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in variants and quality > best:
+            chosen, best = encoding, quality
+    return chosen
+
+
+class StaticAsset:
+    __slots__ = ("path", "media_type", "body", "variants", "etag", "cache_control")
+
+    def __init__(self, path: str, media_type: str, body: Optional[bytes], etag: str, cache_control: str):
+        self.path = path
+        self.media_type = media_type
+        self.body = body  # None when the file is too large to keep in memory
+        self.variants: Dict[str, bytes] = {}  # content-encoding -> body
+        self.etag = etag
+        self.cache_control = cache_control
+
+
+class StaticSite:
+    """The React build directory, indexed once at startup and served from memory.
+
+    Every file gets a strong ETag; files with hashed names (and everything listed in asset-manifest.json) are
+    served as immutable, the rest must revalidate. gzip/brotli variants come from .gz/.br files next to the
+    original when the build produced them, otherwise they are compressed here once. Unknown paths get
+    index.html so client-side routes still load the app.
+    """
+
+    def __init__(self, root: str, max_in_memory_bytes: int = 8 * 1024 * 1024):
+        self.root = root
+        self.max_in_memory_bytes = max_in_memory_bytes
+        self.assets: Dict[str, StaticAsset] = {}
+        hashed_paths = self._manifest_paths()
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith((".gz", ".br")):
+                    continue
+                full_path = os.path.join(directory, filename)
+                relative = os.path.relpath(full_path, root).replace(os.sep, "/")
+                immutable = relative in hashed_paths or bool(HASHED_NAME.search(filename))
+                self.assets[relative] = self._load(full_path, immutable)
+        self.index = self.assets.get("index.html")
+
+    def _manifest_paths(self):
+        try:
+            with open(os.path.join(self.root, "asset-manifest.json")) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        return {
+            path.lstrip("/") for path in manifest.get("files", {}).values()
+            if path.lstrip("/") != "index.html"
+        }
+
+    def _load(self, full_path: str, immutable: bool) -> StaticAsset:
+        media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        cache_control = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+        if os.path.getsize(full_path) > self.max_in_memory_bytes:
+            stat = os.stat(full_path)
+            return StaticAsset(full_path, media_type, None, f'"{stat.st_size:x}-{int(stat.st_mtime):x}"', cache_control)
+
+        with open(full_path, "rb") as f:
+            body = f.read()
+        asset = StaticAsset(full_path, media_type, body, f'"{hashlib.sha1(body).hexdigest()[:20]}"', cache_control)
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if os.path.isfile(full_path + suffix):
+                with open(full_path + suffix, "rb") as f:
+                    asset.variants[encoding] = f.read()
+        if len(body) >= MIN_COMPRESS_BYTES and media_type.startswith(COMPRESSIBLE_TYPES):
+            if "gzip" not in asset.variants:
+                asset.variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if "br" not in asset.variants and brotli is not None:
+                asset.variants["br"] = brotli.compress(body)
+        return asset
+
+    def lookup(self, path: str) -> Optional[StaticAsset]:
+        path = path.lstrip("/")
+        asset = self.assets.get(path)
+        # /static/<file> used to be a mount onto the build root; keep those URLs working
+        if asset is None and path.startswith("static/"):
+            asset = self.assets.get(path[len("static/"):])
+        return asset
+
+    def serve(self, path: str, headers) -> Response:
+        asset = self.lookup(path) or self.index
+        if asset is None:
+            return Response(status_code=404)
+
+        encoding = choose_encoding(asset.variants, headers.get("accept-encoding", ""))
+        # each encoded representation gets its own strong ETag
+        etag = f'{asset.etag[:-1]}-{encoding}"' if encoding else asset.etag
+        response_headers = {"ETag": etag, "Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and (
+            if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+        ):
+            return Response(status_code=304, headers=response_headers)
+
+        if asset.body is None:
+            return FileResponse(asset.path, media_type=asset.media_type, headers=response_headers)
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+            return Response(asset.variants[encoding], media_type=asset.media_type, headers=response_headers)
+        return Response(asset.body, media_type=asset.media_type, headers=response_headers)
@@ -0,0 +1,58 @@
+import copy
+import json
+
+from client_repository import ClientRepository
+from client_search import ClientSearchIndex
+
+BOOK = {
+    "Boston": [
+        {"name": "Ada Park", "age": 61, "risk_profile": "Low", "meeting_notes": "Asked about trusts and a will."},
+        {"name": "Ben Ortiz", "age": 38, "risk_profile": "High", "meeting_notes": "Wants 529 plans for two kids."},
+        {"name": "Cy Lund", "age": 55, "risk_profile": "Moderate", "details": "Holds municipal bonds."},
+    ],
+    "Denver": [
+        {"name": "Dee Marsh", "age": 47, "risk_profile": "High", "meeting_notes": "Retirement plans and bonds."},
+    ],
+}
+QUERIES = ["trusts will", "bonds", "529 plans", "retirement bonds", "estate"]
+
+
+def repository(book):
+    clients = ClientRepository()
+    clients.load(copy.deepcopy(book))
+    return clients
+
+
+def results(index):
+    return {query: json.loads(index.search_json(query, limit=10)) for query in QUERIES}
+
+
+def changed_book():
+    book = copy.deepcopy(BOOK)
+    book["Boston"][0]["meeting_notes"] = "Only bonds, bonds and more bonds."
+    del book["Boston"][1]
+    book["Chicago"] = [{"name": "Eve Stone", "age": 70, "risk_profile": "Low", "meeting_notes": "Estate and trusts."}]
+    return book
+
+
+def test_forked_sync_matches_a_fresh_build():
+    served = ClientSearchIndex.from_repository(repository(BOOK))
+    fork = served.fork()
+    counts = fork.sync(repository(changed_book()))
+    assert counts == {"added": 1, "updated": 1, "removed": 1}
+    assert results(fork) == results(ClientSearchIndex.from_repository(repository(changed_book())))
+
+
+def test_forked_sync_leaves_the_served_index_unchanged():
+    served = ClientSearchIndex.from_repository(repository(BOOK))
+    before = results(served)
+    served.fork().sync(repository(changed_book()))
+    assert results(served) == before
+    assert len(served) == 4
+
+
+def test_resync_of_an_unchanged_book_reindexes_nothing():
+    clients = repository(BOOK)
+    index = ClientSearchIndex.from_repository(clients)
+    assert index.sync(repository(BOOK)) == {"added": 0, "updated": 0, "removed": 0}
+    assert results(index) == results(ClientSearchIndex.from_repository(clients))
@@ -0,0 +1,62 @@
+import json
+import os
+
+import pytest
+
+from datasets import DatasetStore
+
+CLIENTS = {"Boston": [{"name": "Ada Park", "age": 61, "risk_profile": "Low", "meeting_notes": "Asked about trusts."}]}
+FUNDS = [{
+    "name": "US Large Cap Value Fund", "ticker": "USLVX", "category": "Large Value", "risk_level": "Low",
+    "morningstar_rating": 5, "expense_ratio": 0.0005, "minimum_investment": 2500, "total_return_ytd": 9.34,
+}]
+
+
+def write(path, data):
+    with open(path, "w") as f:
+        f.write(data if isinstance(data, str) else json.dumps(data))
+    # a new modification time even on filesystems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+@pytest.fixture
+def store(tmp_path):
+    clients_path, funds_path = str(tmp_path / "clients.json"), str(tmp_path / "funds.json")
+    write(clients_path, CLIENTS)
+    write(funds_path, FUNDS)
+    return DatasetStore.open(clients_path, funds_path)
+
+
+@pytest.mark.parametrize("malformed", [
+    '{"Boston": [',  # cut off mid-write
+    {"Boston": ["not a record"]},
+    {"Boston": [{"name": "Bad Age", "age": {"years": 3}}]},
+])
+def test_malformed_book_keeps_the_current_snapshot(store, malformed):
+    served = store.snapshot()
+    write(store.clients_path, malformed)
+    assert store.reload() is False
+    assert store.snapshot() is served
+    assert store.status()["version"] == 1
+    assert store.failures == 1 and store.last_error
+    assert [client["name"] for _, client in served.clients.by_name("Ada Park")] == ["Ada Park"]
+    # a failed file is not retried until it changes, unless forced
+    assert store.reload() is False and store.failures == 1
+    assert store.reload(force=True) is False and store.failures == 2
+
+
+def test_fixed_book_is_swapped_in_after_a_failure(store):
+    write(store.clients_path, '{"Boston": [')
+    assert store.reload() is False
+    write(store.clients_path, {"Denver": [{"name": "Dee Marsh", "age": 47}]})
+    assert store.reload() is True
+    assert store.snapshot().version == 2
+    assert store.snapshot().clients.cities() == ["Denver"]
+    assert store.last_error is None
+
+
+def test_forced_reload_of_unchanged_files_keeps_the_snapshot(store):
+    served = store.snapshot()
+    assert store.reload(force=True) is False
+    assert store.snapshot() is served
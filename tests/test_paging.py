@@ -0,0 +1,72 @@
+import base64
+import json
+
+import pytest
+
+from paging import MAX_PAGE_SIZE, CursorError, decode_cursor, encode_cursor, page_json, query_fingerprint
+
+RECORDS = [json.dumps({"name": f"Client {n}"}) for n in range(7)]
+FINGERPRINT = query_fingerprint("get_clients", {"city": "Boston", "fields": []})
+
+
+def page(limit=None, cursor=None, version=1, fingerprint=FINGERPRINT):
+    return json.loads(page_json("clients", RECORDS, fingerprint, version, limit, cursor))
+
+
+def test_cursor_round_trip_visits_every_record_once():
+    seen, cursor = [], None
+    while True:
+        result = page(limit=3, cursor=cursor)
+        assert result["total"] == len(RECORDS)
+        seen += [client["name"] for client in result["clients"]]
+        cursor = result["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"Client {n}" for n in range(7)]
+
+
+def test_cursor_keeps_its_page_size():
+    first = page(limit=2)
+    assert len(page(cursor=first["next_cursor"])["clients"]) == 2
+
+
+def test_page_size_defaults_to_and_is_capped_by_the_maximum():
+    records = [json.dumps(n) for n in range(MAX_PAGE_SIZE + 5)]
+    default = json.loads(page_json("funds", records, FINGERPRINT, 1))
+    capped = json.loads(page_json("funds", records, FINGERPRINT, 1, limit=MAX_PAGE_SIZE * 10))
+    assert len(default["funds"]) == len(capped["funds"]) == MAX_PAGE_SIZE
+    assert default["next_cursor"] is not None
+
+
+def test_tampered_cursor_is_rejected():
+    cursor = page(limit=3)["next_cursor"]
+    with pytest.raises(CursorError):
+        page(cursor=cursor[:-4] + "AAAA")
+    with pytest.raises(CursorError):
+        page(cursor="not a cursor")
+    forged = base64.urlsafe_b64encode(json.dumps(["elsewhere", 0, 3, 1]).encode()).decode().rstrip("=")
+    with pytest.raises(CursorError, match="different query"):
+        page(cursor=forged)
+    for offset, limit in ((-3, 3), (0, 0)):
+        with pytest.raises(CursorError, match="not one this tool returned"):
+            page(cursor=encode_cursor(FINGERPRINT, offset, limit, 1))
+
+
+def test_cursor_for_another_query_is_rejected():
+    cursor = page(limit=3)["next_cursor"]
+    other = query_fingerprint("get_clients", {"city": "Chicago", "fields": []})
+    with pytest.raises(CursorError, match="different query"):
+        page(cursor=cursor, fingerprint=other)
+
+
+def test_cursor_from_before_a_reload_is_rejected():
+    cursor = page(limit=3, version=1)["next_cursor"]
+    with pytest.raises(CursorError, match="reloaded"):
+        page(cursor=cursor, version=2)
+
+
+def test_fingerprint_ignores_paging_arguments():
+    assert query_fingerprint("get_funds", {"risk_level": "Low", "limit": 5, "cursor": "x"}) == query_fingerprint(
+        "get_funds", {"risk_level": "Low"}
+    )
+    assert decode_cursor(encode_cursor(FINGERPRINT, 4, 2, 3), FINGERPRINT, 3) == (4, 2)
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from upstream import CircuitBreaker, UpstreamClient, UpstreamUnavailable
+
+
+def connection_error():
+    return openai.APIConnectionError(request=httpx.Request("POST", "http://upstream.test/v1/chat/completions"))
+
+
+class FakeCompletions:
+    """Chat completions that fail, hang or answer, as the test sets mode"""
+
+    def __init__(self):
+        self.mode = "ok"
+        self.calls = 0
+
+    async def create(self, timeout=None, **kwargs):
+        self.calls += 1
+        if self.mode == "fail":
+            raise connection_error()
+        if self.mode == "hang":
+            await asyncio.sleep(10)
+        return "ok"
+
+
+def upstream_client(completions, breaker):
+    return UpstreamClient(
+        SimpleNamespace(chat=SimpleNamespace(completions=completions)), max_retries=0, max_in_flight=2, breaker=breaker,
+    )
+
+
+def test_breaker_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_admits_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    # another call finishing meanwhile does not give the trial slot back
+    breaker.record_failure()
+    assert not breaker.allow()
+    breaker.release_trial()
+    assert breaker.allow()
+
+
+def test_trial_success_closes_and_trial_failure_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_success()
+    breaker.release_trial()
+    assert breaker.state == "closed"
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+    breaker.record_failure()
+    breaker.opened_at -= 60  # the reset window has passed
+    assert breaker.allow()
+    breaker.record_failure()
+    breaker.release_trial()
+    assert breaker.state == "open"
+
+
+def test_open_breaker_fails_fast_without_calling_upstream():
+    async def scenario():
+        completions = FakeCompletions()
+        completions.mode = "fail"
+        client = upstream_client(completions, CircuitBreaker(failure_threshold=1, reset_seconds=60))
+        with pytest.raises(UpstreamUnavailable):
+            await client.create_completion()
+        with pytest.raises(UpstreamUnavailable):
+            await client.create_completion()
+        return completions.calls
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_cancelled_trial_gives_the_slot_back():
+    async def scenario():
+        completions = FakeCompletions()
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+        breaker.record_failure()
+        client = upstream_client(completions, breaker)
+        completions.mode = "hang"
+        trial = asyncio.create_task(client.create_completion())
+        await asyncio.sleep(0.05)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        completions.mode = "ok"
+        return await client.create_completion(), breaker.state
+
+    assert asyncio.run(scenario()) == ("ok", "closed")
+
+
+def test_call_cut_off_by_its_budget_is_not_a_failure():
+    async def scenario():
+        completions = FakeCompletions()
+        completions.mode = "hang"
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+        client = upstream_client(completions, breaker)
+        with pytest.raises(UpstreamUnavailable):
+            await client.create_completion(deadline=time.monotonic() + 0.05)
+        return breaker.state, breaker.failures
+
+    assert asyncio.run(scenario()) == ("closed", 0)
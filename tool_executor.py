@@ -0,0 +1,56 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Every blocking tool is an in-process lookup; email is queued (mailer.mail_queue) and bounded by SMTP_TIMEOUT_SECONDS
+DEFAULT_TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT_SECONDS", "10"))
+
+# Bounded pool for the synchronous tools (the client and fund lookups), so no lookup over a large book runs on the
+# event loop
+tool_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TOOL_MAX_WORKERS", "8")),
+    thread_name_prefix="tool",
+)
+
+
+def tool_error(function_name: str, error: str, **details) -> str:
+    return json.dumps({"error": f"{function_name}: {error}", **details})
+
+
+async def run_blocking_tool(function_name: str, func, **kwargs) -> str:
+    """Run a synchronous tool on the tool pool, giving up after TOOL_TIMEOUT_SECONDS.
+
+    A timed-out call keeps its worker thread until it returns; the model just gets an error result instead of waiting.
+    """
+    timeout = DEFAULT_TOOL_TIMEOUT
+    loop = asyncio.get_running_loop()
+    # in the caller's context, so the tool reads the dataset snapshot its chat turn pinned
+    context = contextvars.copy_context()
+    try:
+        return await asyncio.wait_for(
+            loop.run_in_executor(tool_pool, functools.partial(context.run, func, **kwargs)),
+            timeout=timeout,
+        )
+    except asyncio.TimeoutError:
+        return tool_error(function_name, f"timed out after {timeout:g}s")
+
+
+async def execute_tool_calls(tool_calls, call_tool):
+    """Run every function tool call from one model turn concurrently.
+
+    Returns (tool_call, result) pairs in the order the model emitted them, so results stay matched to their
+    tool_call_id. A call that raises produces an error result rather than failing the whole turn.
+    """
+    function_calls = [tool_call for tool_call in tool_calls or [] if tool_call.type == "function"]
+    results = await asyncio.gather(
+        *(call_tool(tool_call) for tool_call in function_calls),
+        return_exceptions=True,
+    )
+    return [
+        (tool_call, tool_error(tool_call.function.name, str(result)) if isinstance(result, Exception) else result)
+        for tool_call, result in zip(function_calls, results)
+    ]
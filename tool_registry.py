@@ -0,0 +1,183 @@
+import ast
+import json
+import math
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib decoder is used without it
+    orjson = None
+
+from tool_executor import tool_error
+
+
+class ArgumentError(ValueError):
+    """Tool arguments that could not be parsed or do not match the tool's schema"""
+
+    def __init__(self, problems: List[dict]):
+        super().__init__("; ".join(f"{problem['path']}: {problem['message']}" for problem in problems))
+        self.problems = problems
+
+
+def decode_arguments(raw: Optional[str]) -> Any:
+    """Decode the arguments string of a tool call, which the model sends as JSON"""
+    if not raw or not raw.strip():
+        return {}
+    try:
+        return orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except ValueError:
+        pass
+    # older prompts produced Python-style literals ('single quotes', True); accept them on the slow path
+    try:
+        return ast.literal_eval(raw)
+    except (ValueError, SyntaxError, RecursionError):
+        raise ArgumentError([{"path": "$", "message": "arguments are not valid JSON"}]) from None
+
+
+def _compile(schema: dict, path: str) -> Callable[[Any, List[dict]], Any]:
+    """Validator for one JSON schema node: returns the value coerced to the schema's type, appending any problems"""
+    kind = schema.get("type")
+    enum = schema.get("enum")
+    minimum = schema.get("minimum")
+    maximum = schema.get("maximum")
+
+    def check_bounds(value, problems, where):
+        if minimum is not None and value < minimum:
+            problems.append({"path": where, "message": f"must be at least {minimum}"})
+        if maximum is not None and value > maximum:
+            problems.append({"path": where, "message": f"must be at most {maximum}"})
+        return value
+
+    if kind == "object":
+        properties = {
+            name: _compile(subschema, f"{path}.{name}" if path else name)
+            for name, subschema in schema.get("properties", {}).items()
+        }
+        required = schema.get("required", [])
+
+        def validate_object(value, problems, where=path):
+            if not isinstance(value, dict):
+                problems.append({"path": where or "$", "message": "must be an object"})
+                return value
+            result = {}
+            for name in required:
+                if value.get(name) is None:
+                    problems.append({"path": f"{where}.{name}" if where else name, "message": "is required"})
+            for name, item in value.items():
+                # unknown keys and explicit nulls for optional fields are dropped rather than failing the call
+                if name in properties and item is not None:
+                    result[name] = properties[name](item, problems, f"{where}.{name}" if where else name)
+            return result
+
+        return validate_object
+
+    if kind == "array":
+        validate_item = _compile(schema.get("items", {}), path)
+
+        def validate_array(value, problems, where=path):
+            if isinstance(value, (str, dict)) or not hasattr(value, "__iter__"):
+                value = [value]  # a lone item where a list was expected
+            return [validate_item(item, problems, f"{where}[{index}]") for index, item in enumerate(value)]
+
+        return validate_array
+
+    if kind == "string":
+        choices = {choice.lower(): choice for choice in enum} if enum else None
+
+        def validate_string(value, problems, where=path):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = str(value)
+            if not isinstance(value, str):
+                problems.append({"path": where, "message": "must be a string"})
+                return value
+            if choices is not None:
+                if value.strip().lower() not in choices:
+                    problems.append({"path": where, "message": f"must be one of {', '.join(enum)}"})
+                    return value
+                return choices[value.strip().lower()]
+            return value
+
+        return validate_string
+
+    if kind in ("integer", "number"):
+        expected = "must be an integer" if kind == "integer" else "must be a number"
+
+        def validate_number(value, problems, where=path):
+            if isinstance(value, str):
+                try:
+                    value = float(value.strip().replace(",", ""))
+                except ValueError:
+                    problems.append({"path": where, "message": expected})
+                    return value
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                problems.append({"path": where, "message": expected})
+                return value
+            if isinstance(value, float) and not math.isfinite(value):
+                # "nan", "inf" or 1e400: no tool means these, and int() of one would raise
+                problems.append({"path": where, "message": "must be a finite number"})
+                return value
+            if kind == "integer":
+                if value != int(value):
+                    problems.append({"path": where, "message": "must be a whole number"})
+                    return value
+                value = int(value)
+            return check_bounds(value, problems, where)
+
+        return validate_number
+
+    if kind == "boolean":
+        def validate_boolean(value, problems, where=path):
+            if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+                return value.strip().lower() == "true"
+            if not isinstance(value, bool):
+                problems.append({"path": where, "message": "must be true or false"})
+            return value
+
+        return validate_boolean
+
+    return lambda value, problems, where=path: value
+
+
+class ToolRegistry:
+    """Tool handlers keyed by name, with argument validators compiled once from the tool definitions.
+
+    Handlers are async callables taking the validated arguments as keyword arguments and returning the tool's
+    result string.
+    """
+
+    def __init__(self):
+        self.handlers: Dict[str, Callable] = {}
+        self.validators: Dict[str, Callable] = {}
+
+    def register(self, name: str):
+        def decorator(handler):
+            self.handlers[name] = handler
+            return handler
+
+        return decorator
+
+    def compile(self, tools: List[dict]) -> None:
+        for tool in tools:
+            function = tool["function"]
+            self.validators[function["name"]] = _compile(function.get("parameters", {"type": "object"}), "")
+
+    def parse(self, name: str, raw_arguments: Optional[str]) -> dict:
+        """Decode and validate a tool call's arguments, raising ArgumentError with every problem found"""
+        if name not in self.handlers:
+            raise ArgumentError([{"path": "$", "message": f"unknown tool {name!r}"}])
+        arguments = decode_arguments(raw_arguments)
+        problems: List[dict] = []
+        validator = self.validators.get(name)
+        if validator is not None:
+            arguments = validator(arguments, problems)
+        if problems:
+            raise ArgumentError(problems)
+        return arguments
+
+    async def dispatch(self, name: str, arguments: dict) -> str:
+        return await self.handlers[name](**arguments)
+
+
+def argument_error(function_name: str, error: ArgumentError) -> str:
+    """Tool result telling the model exactly what was wrong with its call, so it can fix it in one go"""
+    return tool_error(function_name, "invalid arguments", problems=error.problems)
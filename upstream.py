@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Optional
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from observability import Counter, get_logger, log_event, registry
+
+
+logger = get_logger("upstream")
+
+upstream_attempts = registry.register(Counter(
+    "advisor_upstream_attempts_total", "Upstream completion attempts by outcome", ("outcome",),
+))
+
+
+class UpstreamUnavailable(Exception):
+    """The completion could not be obtained: breaker open, retries exhausted or deadline passed"""
+
+
+class LoopLocal:
+    """An asyncio primitive made on first use inside the running loop, and again if a later loop uses it.
+
+    Built at import time instead, a Lock or Semaphore binds to whatever loop get_event_loop() returns then, and
+    on Python 3.9 the first contended acquire under the server's loop fails with "attached to a different loop".
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._loop = None
+        self._value = None
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._value = loop, self.factory()
+        return self._value
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = LoopLocal(asyncio.Lock)
+
+    async def acquire(self) -> None:
+        async with self._lock.get():
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures and fails fast for reset_seconds.
+
+    After that a single trial call is let through (half-open): success closes the breaker, failure re-opens it.
+    Only the call that allow() admitted as the trial gives the slot back (release_trial), so the outcome of some
+    other call finishing meanwhile cannot let a second probe through.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release_trial(self) -> None:
+        """Give back the half-open trial slot once the trial call has finished, however it ended"""
+        self._trial_in_flight = False
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError, asyncio.TimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class UpstreamClient:
+    """Chat completions with a bounded connection pool, a concurrency cap, a rate limit, retries and a circuit breaker.
+
+    create_completion() takes an absolute deadline (time.monotonic()) from the request's budget: every attempt's
+    timeout and every backoff sleep is clipped to it, so a chat turn never outlives its budget. A streamed
+    completion keeps its concurrency slot, and stays bound by the deadline, until its last chunk is read.
+    """
+
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        timeout: float = 120,
+        max_in_flight: int = 32,
+        rate_per_second: float = 20,
+        burst: float = 40,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.client = client
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._in_flight = LoopLocal(lambda: asyncio.Semaphore(max_in_flight))
+        self._bucket = TokenBucket(rate_per_second, burst)
+
+    def _remaining(self, deadline: Optional[float]) -> float:
+        if deadline is None:
+            return self.timeout
+        return min(self.timeout, deadline - time.monotonic())
+
+    async def _within(self, waiting, deadline: Optional[float], what: str) -> None:
+        """Wait for a rate-limit token or a free slot, but no longer than the request budget allows"""
+        remaining = self._remaining(deadline)
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            await asyncio.wait_for(waiting, remaining)
+        except asyncio.TimeoutError:
+            if asyncio.iscoroutine(waiting):
+                waiting.close()
+            upstream_attempts.inc(outcome="deadline")
+            raise UpstreamUnavailable(f"Request budget exhausted {what}") from None
+
+    async def _stream_within(self, stream, slots: asyncio.Semaphore, deadline: Optional[float]):
+        """Chunks of a streamed completion, holding the in-flight slot until the stream ends or is abandoned"""
+        try:
+            chunks = stream.__aiter__()
+            while True:
+                remaining = self._remaining(deadline)
+                if remaining <= 0:
+                    raise UpstreamUnavailable("Request budget exhausted while the model was responding")
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), remaining)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise UpstreamUnavailable("Request budget exhausted while the model was responding") from None
+                yield chunk
+        finally:
+            slots.release()
+
+    async def create_completion(self, deadline: Optional[float] = None, **kwargs):
+        attempt = 0
+        while True:
+            await self._within(self._bucket.acquire(), deadline, "waiting for the upstream rate limit")
+            # checked last, so nothing between taking a half-open trial and making the call can strand it
+            trial = self.breaker.state == "half_open"
+            if not self.breaker.allow():
+                upstream_attempts.inc(outcome="breaker_open")
+                raise UpstreamUnavailable("The model service is temporarily unavailable, please retry shortly")
+            try:
+                slots = self._in_flight.get()
+                await self._within(slots.acquire(), deadline, "waiting for a free upstream slot")
+                try:
+                    remaining = self._remaining(deadline)  # what the waits above left of the budget
+                    if remaining <= 0:
+                        upstream_attempts.inc(outcome="deadline")
+                        raise UpstreamUnavailable("Request budget exhausted before the model responded")
+                    # httpx's timeout applies per read; wait_for bounds the whole call by the budget
+                    response = await asyncio.wait_for(
+                        self.client.chat.completions.create(timeout=remaining, **kwargs), remaining
+                    )
+                except asyncio.TimeoutError:
+                    slots.release()
+                    if deadline is not None and self._remaining(deadline) <= 0:
+                        # cut off by this request's budget, not a sign the service is failing
+                        upstream_attempts.inc(outcome="deadline")
+                        raise UpstreamUnavailable("Request budget exhausted before the model responded") from None
+                    raise
+                except BaseException:
+                    slots.release()
+                    raise
+                if kwargs.get("stream"):
+                    response = self._stream_within(response, slots, deadline)
+                else:
+                    slots.release()
+            except UpstreamUnavailable:
+                # the budget ran out before a request was sent, which says nothing about the service
+                raise
+            except Exception as error:
+                if not is_retryable(error):
+                    # the service answered, it just rejected this request
+                    self.breaker.record_success()
+                    upstream_attempts.inc(outcome="error")
+                    raise
+                self.breaker.record_failure()
+                upstream_attempts.inc(outcome="retryable_error")
+                log_event(logger, logging.WARNING, "upstream_retryable_error", attempt=attempt, error=type(error).__name__)
+                if attempt >= self.max_retries:
+                    raise UpstreamUnavailable(f"The model service failed after {attempt + 1} attempts") from error
+                delay = retry_after_seconds(error)
+                if delay is None:
+                    # full jitter exponential backoff
+                    delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                if delay >= self._remaining(deadline):
+                    raise UpstreamUnavailable("Request budget exhausted while retrying the model") from error
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                if trial:
+                    self.breaker.release_trial()
+
+            self.breaker.record_success()
+            upstream_attempts.inc(outcome="success")
+            return response
+
+
+def create_upstream_client(llm_config) -> UpstreamClient:
+    """OpenAI client on a tunable connection pool, wrapped with the retry/limit policy from the environment"""
+    timeout = float(llm_config.get("timeout", 120))
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "64")),
+            max_keepalive_connections=int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "32")),
+            keepalive_expiry=float(os.getenv("UPSTREAM_KEEPALIVE_SECONDS", "30")),
+        ),
+        timeout=httpx.Timeout(timeout, connect=float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "10"))),
+    )
+    client = AsyncOpenAI(
+        api_key=llm_config["api_key"],
+        base_url=llm_config["base_url"],
+        http_client=http_client,
+        max_retries=0,  # retries are handled by UpstreamClient
+    )
+    return UpstreamClient(
+        client,
+        timeout=timeout,
+        max_in_flight=int(os.getenv("UPSTREAM_MAX_IN_FLIGHT", "32")),
+        rate_per_second=float(os.getenv("UPSTREAM_RATE_PER_SECOND", "20")),
+        burst=float(os.getenv("UPSTREAM_BURST", "40")),
+        max_retries=int(os.getenv("UPSTREAM_MAX_RETRIES", "3")),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("UPSTREAM_BREAKER_THRESHOLD", "5")),
+            reset_seconds=float(os.getenv("UPSTREAM_BREAKER_RESET_SECONDS", "30")),
+        ),
+    )